@@ -0,0 +1,258 @@
+"""
+Canonical registry of form/profile fields and their aliases, shared by the RAG pipeline,
+the PDF writer and the online form fillers.
+The registry is compiled once at import into:
+  - a hash index from normalized alias (lowercase, alphanumerics only) to canonical field,
+    for O(1) lookups of whole field names (plus one without the generic aliases), and
+  - an Aho-Corasick automaton over the aliases' word sequences, for finding every field
+    mentioned in a line of text in a single linear pass.
+"""
+import re
+from collections import Counter, deque
+
+# canonical field -> aliases, and optionally a group: fields in the same group hold the same
+# datum at different specificity (a profile's "phone" can take a form's "cell phone")
+FIELD_SCHEMA = {
+    # Personal information
+    "full_name": {"group": "name", "aliases": ["name", "full name", "fullName", "userName",
+                                               "name last first middle"]},
+    "first_name": {"aliases": ["first name", "fname", "patient first name", "patient name"]},
+    "middle_initial": {"aliases": ["middle initial", "mi", "middle name", "patient middle initial"]},
+    "last_name": {"aliases": ["last name", "lname", "patient last name", "surname"]},
+    "dob": {"aliases": ["date of birth", "birth date", "birthdate", "dateOfBirth", "patient date of birth"]},
+    "gender": {"aliases": ["sex", "patient gender", "patient sex"]},
+    "race": {"aliases": ["ethnicity", "patient race", "patient ethnicity"]},
+    "marital_status": {"aliases": ["marital status", "status", "patient marital status"]},
+    "language": {"aliases": ["preferred language", "patient language", "language preference"]},
+    "ssn": {"aliases": ["social security number", "social security no", "social security",
+                        "socialSecurityNumber", "taxpayerID", "employee social security number"]},
+    "spouse_name": {"aliases": ["spouse name", "spouses name"]},
+
+    # Contact information
+    "address": {"aliases": ["address street", "street address", "street", "patient address",
+                            "patient address street", "homeAddress", "residentialAddress", "mailing address",
+                            "street address and or mailing address"]},
+    "city": {"aliases": ["town", "patient city", "address city", "patient address city"]},
+    "state": {"aliases": ["province", "patient state", "address state", "patient address state"]},
+    "zip_code": {"aliases": ["zip", "zipcode", "postal code", "patient zip", "address zip code",
+                             "patient address zip code"]},
+    "country": {"aliases": []},
+    "phone": {"aliases": ["phone number", "phoneNumber", "contact number"]},
+    "home_phone": {"group": "phone", "aliases": ["home phone", "telephone", "home tel", "home telephone",
+                                                 "home telephone number"]},
+    "work_phone": {"aliases": ["work phone", "business phone", "office phone", "work tel", "work telephone",
+                               "business telephone number"]},
+    "cell_phone": {"group": "phone", "aliases": ["cell phone", "mobile", "mobile phone", "mobile number",
+                                                 "cell", "cellular", "cell telephone", "cellPhone",
+                                                 "cellular telephone number"]},
+    "spouse_phone": {"aliases": ["spouse phone", "spouse phone number"]},
+    "email": {"aliases": ["email address", "e-mail", "patient email", "emailAddress", "userEmail"]},
+
+    # Emergency contact
+    "emergency_contact_name": {"aliases": ["emergency contact", "emergency name", "emergency contact person",
+                                           "emergency contact name"]},
+    "emergency_contact_relationship": {"aliases": ["emergency relationship", "emergency contact relation",
+                                                   "relation to patient", "emergency contact relationship",
+                                                   "relationship"]},
+    "emergency_contact_phone": {"aliases": ["emergency phone", "emergency tel", "emergency contact phone",
+                                            "emergency contact tel", "emergency contact telephone"]},
+
+    # Employment
+    "employment_status": {"aliases": ["employment", "employment type", "work status"]},
+    "occupation": {"aliases": ["job", "position", "profession", "position applying for"]},
+    "industry": {"aliases": ["sector", "field", "business sector"]},
+    "company_name": {"aliases": ["employer", "company", "business name", "place of employment",
+                                 "employer name"]},
+    "company_address": {"aliases": ["company street", "employer address", "business address",
+                                    "company address street"]},
+    "company_city": {"aliases": ["employer city", "business city", "company address city"]},
+    "company_state": {"aliases": ["employer state", "business state", "company address state"]},
+    "company_zip_code": {"aliases": ["company zip", "employer zip", "business zip", "company address zip",
+                                     "company address zip code"]},
+    "ein": {"aliases": ["employer identification number", "employer id number", "fein"]},
+    "income": {"aliases": ["salary", "wages", "earnings", "compensation", "salary desired"]},
+
+    # Insurance
+    "insurance_provider": {"aliases": ["insurance company", "insurer", "insurance", "insurance carrier"]},
+    "group_number": {"aliases": ["group no", "group", "insurance group", "patient group number"]},
+    "policy_number": {"aliases": ["policy no", "policy", "insurance policy", "policy id"]},
+    "subscriber_id": {"aliases": ["subscriber id", "member id", "insurance id", "patient id",
+                                  "patient subscriber id"]},
+    "insurance_type": {"aliases": ["plan type", "coverage type", "type of insurance"]},
+    "insurance_phone": {"aliases": ["insurer phone", "insurance tel", "insurance telephone"]},
+    "subscriber_name": {"aliases": ["subscriber", "policy holder", "insurance holder"]},
+
+    # Medical
+    "allergies": {"aliases": ["patient allergies", "known allergies", "allergy list", "allergic to"]},
+    "reason_for_visit": {"aliases": ["chief complaint", "reason", "symptoms"]},
+    "pcp": {"aliases": ["primary doctor", "doctor name", "physician", "primary care physician",
+                        "primary care physician name"]},
+    "pcp_address": {"aliases": ["doctor address", "physician address", "primary care physician address",
+                                "primary care physician address street"]},
+    "pcp_city": {"aliases": ["doctor city", "physician city", "primary care physician address city"]},
+    "pcp_state": {"aliases": ["doctor state", "physician state", "primary care physician address state"]},
+    "pcp_zip_code": {"aliases": ["doctor zip", "physician zip", "pcp zip",
+                                 "primary care physician address zip",
+                                 "primary care physician address zip code"]},
+
+    # Appointment
+    "appointment_date_1": {"aliases": ["appointment date", "appt date", "preferred date",
+                                       "desired appointment date", "desired appointment date 1"]},
+    "appointment_time_1": {"aliases": ["appointment time", "appt time", "preferred time",
+                                       "desired appointment time", "desired appointment time 1"]},
+    "appointment_date_2": {"aliases": ["alternate date", "second date", "backup date",
+                                       "desired appointment date 2"]},
+    "appointment_time_2": {"aliases": ["alternate time", "second time", "backup time",
+                                       "desired appointment time 2"]},
+
+    # Signature
+    "date": {"aliases": ["signature date", "today's date", "form date"]},
+    "signature": {"aliases": ["patient signature", "signature of patient", "e-signature"]},
+
+    # School
+    "university": {"aliases": ["college", "school"]},
+    "student_id": {"aliases": ["stanford id", "student id", "id"]},
+    "major": {"aliases": ["field of study"]},
+    "grade": {"aliases": ["class"]},
+    "injury_description": {"aliases": ["injury"]},
+}
+
+# Single-word aliases too vague to identify a field on their own ("status" may be marital or
+# employment status). They still mark form labels, but canonical_field(name, generic=False),
+# used when matching profile keys, ignores them.
+GENERIC_ALIASES = {"status", "position", "id", "cell", "street", "school", "reason", "relationship",
+                   "insurance", "class", "group", "field", "policy", "employment"}
+
+
+def normalize_key(name):
+    """Lowercase alphanumerics only: 'Date of Birth', 'date_of_birth' and 'dateOfBirth' -> 'dateofbirth'."""
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def phrase_words(text):
+    """Lowercase words of a field name or line, splitting camelCase ('taxpayerID' -> ['taxpayer', 'id'])."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over word sequences: finds every pattern occurrence in one pass."""
+
+    def __init__(self, patterns):
+        # patterns: {tuple of words: value}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for words, value in patterns.items():
+            state = 0
+            for word in words:
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            self.output[state].append((len(words), value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def search(self, words):
+        """Yield (start, end, value) word-index spans for every pattern found in words."""
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for length, value in self.output[state]:
+                yield i + 1 - length, i + 1, value
+
+
+def _compile(schema, generic_aliases):
+    alias_index, specific_index, groups, patterns = {}, {}, {}, {}
+    for canonical, spec in schema.items():
+        groups[canonical] = spec.get("group") or canonical
+        for alias in [canonical, *spec["aliases"]]:
+            key = normalize_key(alias)
+            if alias_index.get(key, canonical) != canonical:
+                raise ValueError(f"Alias '{alias}' maps to both {alias_index[key]} and {canonical}")
+            alias_index[key] = canonical
+            if alias not in generic_aliases:
+                specific_index[key] = canonical
+            # OCR cleanup often drops in-word punctuation ("E-Signature" -> "ESignature"), so
+            # such aliases are also matched in their compact form
+            for text in {alias, re.sub(r"(?<=\w)['-](?=\w)", "", alias)}:
+                words = tuple(phrase_words(text.replace("_", " ")))
+                if words:
+                    patterns[words] = canonical
+    unknown = set(generic_aliases) - set(alias_index)
+    if unknown:
+        raise ValueError(f"Generic aliases not in the schema: {sorted(unknown)}")
+    return alias_index, specific_index, groups, AhoCorasick(patterns)
+
+
+ALIAS_INDEX, SPECIFIC_ALIAS_INDEX, FIELD_GROUPS, ALIAS_MATCHER = _compile(FIELD_SCHEMA, GENERIC_ALIASES)
+
+
+def _kind_words(schema):
+    # Last words shared by several canonical fields ("name", "address", "date") say what kind of
+    # datum a field holds rather than whose it is, so sharing one doesn't relate two field names
+    counts = Counter()
+    for canonical in schema:
+        words = [word for word in phrase_words(canonical.replace("_", " ")) if not word.isdigit()]
+        if len(words) > 1:
+            counts[words[-1]] += 1
+    return frozenset(word for word, count in counts.items() if count > 1)
+
+
+FIELD_KIND_WORDS = _kind_words(FIELD_SCHEMA)
+
+
+def canonical_field(name, generic=True):
+    """
+    Canonical field for a whole field name (any alias, case and punctuation ignored), or None.
+    With generic=False, names that are only a generic alias (see GENERIC_ALIASES) give None.
+    """
+    index = ALIAS_INDEX if generic else SPECIFIC_ALIAS_INDEX
+    return index.get(normalize_key(name))
+
+
+def field_group(name, generic=True):
+    """Group of the field name's canonical field (e.g. 'mobile' -> 'phone'), or None if unknown."""
+    canonical = canonical_field(name, generic)
+    return FIELD_GROUPS[canonical] if canonical else None
+
+
+def find_fields(text):
+    """Every field alias mentioned in text as whole words, as (start, end, canonical) word spans."""
+    return list(ALIAS_MATCHER.search(phrase_words(text)))
+
+
+def best_field(text):
+    """Canonical field of the longest alias mentioned in text (earliest on ties), or None."""
+    matches = find_fields(text)
+    if not matches:
+        return None
+    start, end, canonical = max(matches, key=lambda match: (match[1] - match[0], -match[0]))
+    return canonical
+
+
+def describe_field_groups(names):
+    """One "group = alias, alias, ..." line per field group the given field names belong to."""
+    members = {}
+    for canonical in FIELD_SCHEMA:
+        members.setdefault(FIELD_GROUPS[canonical], []).append(canonical)
+    groups = dict.fromkeys(group for group in map(field_group, names) if group)
+    return [
+        f"{group} = " + ", ".join(alias for canonical in members[group]
+                                  for alias in [canonical, *FIELD_SCHEMA[canonical]["aliases"]])
+        for group in groups
+    ]
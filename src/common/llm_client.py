@@ -0,0 +1,394 @@
+"""
+Provider-agnostic chat client shared by the RAG pipeline, the form fillers and the model interfaces.
+Talks to Ollama's /api/chat or any OpenAI-compatible /chat/completions endpoint over pooled keep-alive
+HTTP connections, with per-call timeouts (0 for none), bounded retries with exponential backoff on
+connection errors, 429 and 5xx responses, and latency/token metrics. A request that times out
+waiting for the model is not retried: the next attempt would only wait out the same deadline.
+
+    llm = get_client("ollama", "llama3.2-vision:11b", temperature=0.3)
+    llm.invoke(input="Hello").content
+    llm.chat([{"role": "user", "content": "Hello"}], timeout=30).content
+    for delta in llm.stream("Hello"): print(delta, end="")
+"""
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from collections import deque
+import httpx
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+DEFAULT_TIMEOUT_SECONDS = 120.0         # Deadline per HTTP attempt (local models can be slow to load)
+CONNECT_TIMEOUT_SECONDS = 5.0
+DEFAULT_MAX_RETRIES = 2                 # Retries per call on connection errors, 429 and 5xx (not read timeouts)
+DEFAULT_RETRY_BACKOFF_SECONDS = 0.5     # Doubled after each retry
+MAX_RETRY_AFTER_SECONDS = 30.0          # Cap on a server-requested Retry-After delay
+MAX_KEEPALIVE_CONNECTIONS = 8           # Idle connections kept open per endpoint
+MAX_CONNECTIONS = 16                    # Concurrent connections per endpoint
+LATENCY_WINDOW = 1000                   # Most recent call latencies kept for percentiles
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Ollama request fields that sit next to "options" rather than inside it
+OLLAMA_TOP_LEVEL_PARAMS = {"format", "keep_alive", "tools"}
+
+_http_clients = {}
+_clients = {}
+_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """Raised when a chat call fails, after any retries."""
+
+    def __init__(self, message, attempts=1):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class LLMResponse:
+    """A chat completion: its text as .content, plus the model, token counts and latency of the call."""
+
+    def __init__(self, content, model, prompt_tokens=None, completion_tokens=None, latency_seconds=None, attempts=1,
+                 ttft_seconds=None):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.latency_seconds = latency_seconds
+        self.attempts = attempts
+        self.ttft_seconds = ttft_seconds   # Time to first token, for streamed completions
+
+    def __repr__(self):
+        return (f"LLMResponse(model={self.model!r}, prompt_tokens={self.prompt_tokens}, "
+                f"completion_tokens={self.completion_tokens}, latency_seconds={self.latency_seconds})")
+
+
+class LLMStream:
+    """Iterator over a streamed completion's text deltas; .response holds the LLMResponse once exhausted."""
+
+    def __init__(self):
+        self.response = None
+        self._deltas = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._deltas)
+
+    def close(self):
+        """Stop reading the completion early and release its connection."""
+        self._deltas.close()
+
+
+class LLMMetrics:
+    """Thread-safe call, retry, token, latency and time-to-first-token counters for one client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._ttfts = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, latency_seconds, attempts, prompt_tokens=None, completion_tokens=None, error=False,
+               ttft_seconds=None):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.retries += max(attempts - 1, 0)
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            self._latencies.append(latency_seconds)
+            if ttft_seconds is not None:
+                self._ttfts.append(ttft_seconds)
+
+    def snapshot(self):
+        """Return the counters and p50/p95/max latency (and streamed TTFT) over the last LATENCY_WINDOW calls."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            ttfts = sorted(self._ttfts)
+            stats = {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+        for name, values in (("latency", latencies), ("ttft", ttfts)):
+            if values:
+                stats[f"{name}_p50_seconds"] = round(values[len(values) // 2], 4)
+                stats[f"{name}_p95_seconds"] = round(values[min(int(len(values) * 0.95), len(values) - 1)], 4)
+                stats[f"{name}_max_seconds"] = round(values[-1], 4)
+        return stats
+
+
+def normalize_base_url(url):
+    """Add the http:// scheme OLLAMA_HOST is often given without, and drop any trailing slash."""
+    if "://" not in url:
+        url = f"http://{url}"
+    return url.rstrip("/")
+
+
+def get_http_client(base_url):
+    """Return the process-wide keep-alive connection pool for base_url."""
+    base_url = normalize_base_url(base_url)
+    with _lock:
+        client = _http_clients.get(base_url)
+        if client is None:
+            client = httpx.Client(
+                base_url=base_url,
+                limits=httpx.Limits(
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    max_connections=MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+            )
+            _http_clients[base_url] = client
+        return client
+
+
+def encode_image(image):
+    """Base64-encode image bytes or an image file; other strings are assumed to be base64 already."""
+    if isinstance(image, (bytes, bytearray)):
+        return base64.b64encode(image).decode("utf-8")
+    if os.path.isfile(image):
+        with open(image, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    return image
+
+
+def retry_delay(response, attempt, backoff_seconds):
+    """Seconds to wait before the next attempt, honouring a numeric Retry-After header."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            pass
+    return backoff_seconds * (2 ** attempt)
+
+
+class LLMClient:
+    """
+    Chat model client for one provider ("ollama" or "openai") and model. Keyword options
+    (temperature, top_p, num_ctx, max_tokens, format, ...) are sent with every call and can
+    be overridden per call. Connections are shared by every client of the same endpoint.
+    """
+
+    PROVIDERS = ("ollama", "openai")
+
+    def __init__(self, provider, model, base_url=None, api_key=None, timeout=None,
+                 max_retries=None, retry_backoff_seconds=None, **options):
+        if provider not in self.PROVIDERS:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        self.provider = provider
+        self.model = model
+        self.base_url = normalize_base_url(base_url or (OLLAMA_BASE_URL if provider == "ollama" else OPENAI_BASE_URL))
+        self.api_key = api_key if api_key is not None else os.environ.get("OPENAI_API_KEY")
+        self.timeout = timeout if timeout is not None else DEFAULT_TIMEOUT_SECONDS
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max(max_retries, 0)
+        self.retry_backoff_seconds = (
+            DEFAULT_RETRY_BACKOFF_SECONDS if retry_backoff_seconds is None else retry_backoff_seconds
+        )
+        self.options = options
+        self.metrics = LLMMetrics()
+
+    def invoke(self, input, **options):
+        """Send a prompt string (or a list of chat messages) and return an LLMResponse."""
+        messages = [{"role": "user", "content": input}] if isinstance(input, str) else input
+        return self.chat(messages, **options)
+
+    def stream(self, input, timeout=None, **options):
+        """
+        Send a prompt string (or a list of chat messages) and return an LLMStream yielding the
+        completion's text as it is generated. Failures are only retried before the response starts.
+        """
+        messages = [{"role": "user", "content": input}] if isinstance(input, str) else input
+        path, body = self._request(messages, {**self.options, **options})
+        body["stream"] = True
+        if self.provider == "openai":
+            body.setdefault("stream_options", {"include_usage": True})
+        stream = LLMStream()
+        stream._deltas = self._stream_deltas(stream, path, body, timeout if timeout is not None else self.timeout)
+        return stream
+
+    def chat(self, messages, timeout=None, **options):
+        """Send chat messages ({"role", "content"[, "images"]}) and return an LLMResponse."""
+        path, body = self._request(messages, {**self.options, **options})
+        start = time.perf_counter()
+        try:
+            http_response, attempts = self._send(path, body, timeout if timeout is not None else self.timeout)
+            try:
+                response = self._parse(http_response.json())
+            except ValueError as e:
+                raise LLMError(f"{self.provider}:{self.model} returned invalid JSON: {e}", attempts) from e
+        except Exception as e:
+            self.metrics.record(time.perf_counter() - start, getattr(e, "attempts", 1), error=True)
+            raise
+        response.latency_seconds = round(time.perf_counter() - start, 4)
+        response.attempts = attempts
+        self.metrics.record(response.latency_seconds, attempts, response.prompt_tokens, response.completion_tokens)
+        logging.info(f"{self.provider}:{self.model} answered in {response.latency_seconds}s "
+                     f"({response.prompt_tokens} prompt / {response.completion_tokens} completion tokens"
+                     f"{f', {attempts} attempts' if attempts > 1 else ''})")
+        return response
+
+    def _stream_deltas(self, stream, path, body, timeout):
+        start = time.perf_counter()
+        parts, ttft_seconds, usage, attempts = [], None, {}, 1
+        try:
+            http_response, attempts = self._send(path, body, timeout, stream=True)
+            try:
+                for line in http_response.iter_lines():
+                    delta = self._parse_stream_line(line, usage)
+                    if not delta:
+                        continue
+                    if ttft_seconds is None:
+                        ttft_seconds = round(time.perf_counter() - start, 4)
+                    parts.append(delta)
+                    yield delta
+            finally:
+                http_response.close()
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            self.metrics.record(time.perf_counter() - start, getattr(e, "attempts", attempts), error=True)
+            if isinstance(e, (httpx.TransportError, ValueError)):
+                raise LLMError(f"{self.provider}:{self.model} stream failed: {e}", attempts) from e
+            raise
+        stream.response = LLMResponse(
+            "".join(parts), self.model,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            latency_seconds=round(time.perf_counter() - start, 4),
+            attempts=attempts,
+            ttft_seconds=ttft_seconds,
+        )
+        self.metrics.record(stream.response.latency_seconds, attempts, stream.response.prompt_tokens,
+                            stream.response.completion_tokens, ttft_seconds=ttft_seconds)
+        logging.info(f"{self.provider}:{self.model} streamed {len(parts)} deltas in {stream.response.latency_seconds}s "
+                     f"(first after {ttft_seconds}s, {stream.response.completion_tokens} completion tokens)")
+
+    def _parse_stream_line(self, line, usage):
+        """Return the text delta in one streamed line, collecting token counts into usage."""
+        if self.provider == "ollama":
+            # Newline-delimited JSON; the final object carries the token counts
+            if not line.strip():
+                return ""
+            data = json.loads(line)
+            if data.get("done"):
+                usage["prompt_tokens"] = data.get("prompt_eval_count")
+                usage["completion_tokens"] = data.get("eval_count")
+            return (data.get("message") or {}).get("content", "")
+        # Server-sent events: "data: {...}" lines ending with "data: [DONE]"
+        if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+            return ""
+        data = json.loads(line[5:])
+        if data.get("usage"):
+            usage["prompt_tokens"] = data["usage"].get("prompt_tokens")
+            usage["completion_tokens"] = data["usage"].get("completion_tokens")
+        choices = data.get("choices") or []
+        return (choices[0].get("delta") or {}).get("content") or "" if choices else ""
+
+    def _request(self, messages, options):
+        if self.provider == "ollama":
+            messages = [
+                {**message, "images": [encode_image(image) for image in message["images"]]}
+                if message.get("images") else message
+                for message in messages
+            ]
+            body = {"model": self.model, "messages": messages, "stream": False}
+            sampling = {name: value for name, value in options.items() if name not in OLLAMA_TOP_LEVEL_PARAMS}
+            body.update({name: value for name, value in options.items() if name in OLLAMA_TOP_LEVEL_PARAMS})
+            if sampling:
+                body["options"] = sampling
+            return "/api/chat", body
+        return "/chat/completions", {"model": self.model, "messages": messages, **options}
+
+    def _parse(self, data):
+        if self.provider == "ollama":
+            return LLMResponse(
+                data["message"]["content"],
+                data.get("model", self.model),
+                prompt_tokens=data.get("prompt_eval_count"),
+                completion_tokens=data.get("eval_count"),
+            )
+        usage = data.get("usage") or {}
+        return LLMResponse(
+            data["choices"][0]["message"]["content"],
+            data.get("model", self.model),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def _send(self, path, body, timeout, stream=False):
+        """
+        POST body, retrying connection errors, 429 and 5xx; return (successful response, attempts made).
+        Read and write timeouts fail at once, since the server may still be generating the reply.
+        With stream=True the response body is left unread for the caller to iterate and close.
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.provider == "openai" and self.api_key else {}
+        http = get_http_client(self.base_url)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                request = http.build_request(
+                    "POST", path, json=body, headers=headers,
+                    timeout=httpx.Timeout(timeout or None, connect=CONNECT_TIMEOUT_SECONDS),
+                )
+                response = http.send(request, stream=stream)
+                if response.status_code < 400:
+                    return response, attempt + 1
+                if stream:
+                    response.read()
+                    response.close()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise LLMError(f"{self.provider}:{self.model} request failed with HTTP "
+                                   f"{response.status_code}: {response.text[:500]}", attempt + 1)
+                error = f"HTTP {response.status_code}"
+            except (httpx.ReadTimeout, httpx.WriteTimeout) as e:
+                raise LLMError(f"{self.provider}:{self.model} request timed out after {timeout}s: {e}",
+                               attempt + 1) from e
+            except httpx.TransportError as e:   # Connection failures, connect/pool timeouts and dropped connections
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt == self.max_retries:
+                raise LLMError(f"{self.provider}:{self.model} request failed after {attempt + 1} attempts: {error}",
+                               attempt + 1)
+            delay = retry_delay(response, attempt, self.retry_backoff_seconds)
+            logging.warning(f"{self.provider}:{self.model} request failed ({error}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def get_client(provider, model, **kwargs):
+    """
+    Return the shared LLMClient for provider, model and settings, creating it on first use, so
+    every call site in a process reuses the same connections and accumulates the same metrics.
+    """
+    key = json.dumps([provider, model, kwargs], sort_keys=True, default=str)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LLMClient(provider, model, **kwargs)
+        return client
+
+
+def metrics_snapshot():
+    """Return {"provider:model": metrics} for every shared client that has been used."""
+    with _lock:
+        clients = list(_clients.values())
+    snapshot = {}
+    for client in clients:
+        stats = client.metrics.snapshot()
+        if stats["calls"]:
+            name = f"{client.provider}:{client.model}"
+            # Clients of the same model with different settings are listed separately
+            while name in snapshot:
+                name += "'"
+            snapshot[name] = stats
+    return snapshot
@@ -1,5 +1,8 @@
+import os
 import sys
-import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import get_client
 
 # System prompt defining the assistant's persona and behavior
 SYSTEM_PROMPT = """You are Quill, a friendly and efficient document assistant. 
@@ -36,9 +39,9 @@ def clean_response(text):
     return text.strip()
 
 def send_query(message):
-    response = ollama.chat(
-        'deepseek-r1:8b',
-        messages=[
+    # No deadline, as with ollama.chat: a cold model can take minutes to answer
+    response = get_client("ollama", "deepseek-r1:8b", timeout=0).chat(
+        [
             {
                 'role': 'system',
                 'content': ""
@@ -48,16 +51,14 @@ def send_query(message):
                 'content': SYSTEM_PROMPT + message,
             },
         ],
-        options={
-            'temperature': 0.7,
-            'top_k': 50,
-            'top_p': 0.9,
-            'max_tokens': 100
-        }
+        temperature=0.7,
+        top_k=50,
+        top_p=0.9,
+        max_tokens=100
     )
     
     # Clean and print the response
-    cleaned_response = clean_response(response['message']['content'])
+    cleaned_response = clean_response(response.content)
     print(cleaned_response)
 
 if __name__ == "__main__":
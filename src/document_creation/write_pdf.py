@@ -1,7 +1,6 @@
 import os
 import logging
 import sys
-from openai import OpenAI
 import json
 import base64
 from PIL import Image, ImageDraw, ImageFont
@@ -9,6 +8,10 @@ import ast
 from pdf2image import convert_from_path
 from find_label_coords import find_label_coords
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.field_schema import canonical_field, normalize_key
+from common.llm_client import get_client
+
 """Example script usage: python3 src/document_creation/write_pdf.py SAMPLE_PNG_PATH SAMPLE_JSON"""
 SAMPLE_PNG_PATH = "./W-2.png"
 
@@ -101,7 +104,7 @@ def populate_form(fields, label_coords, img_path):
     and an image path. The function calls an LLM to identify the coordinates of the blanks where 
     the values should be filled in, and then calls overlay_text() to create a filled pdf.
     """
-    client = OpenAI()
+    client = get_client("openai", MODEL_NAME)
     base64_image = encode_image(img_path)
     
     img = Image.open(img_path)
@@ -134,9 +137,8 @@ exactly in this format: [(x1, y1), (x2, y2), (x3, y3)]"""
 
     # Call model to identify coordinates of blanks
     try:
-        completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
+        completion = client.chat(
+            [
                 {"role": "system", "content": enhanced_system_prompt},
                 {
                     "role": "user",
@@ -149,7 +151,7 @@ exactly in this format: [(x1, y1), (x2, y2), (x3, y3)]"""
         )
         
         # Extract and validate the response
-        response_content = completion.choices[0].message.content.strip()
+        response_content = completion.content.strip()
         
         # Check if the response starts with a square bracket (indicating a list)
         if not response_content.startswith('[') or not response_content.endswith(']'):
@@ -201,7 +203,7 @@ def generate_fallback_coordinates(fields, label_coords):
 def normalize_and_match_fields(json_data, label_coords):
     """
     Normalize field names from JSON data and match them with form fields.
-    Handles field name variations and nested structures.
+    Handles field name variations (via the shared field schema) and nested structures.
     
     Args:
         json_data (dict): The original JSON data with field values
@@ -210,80 +212,6 @@ def normalize_and_match_fields(json_data, label_coords):
     Returns:
         dict: Matched fields with their values
     """
-
-    # Create a normalized mapping of common field variations
-    field_variations = {
-        # Personal information
-        "patientfirstname": ["first name", "firstname", "fname", "patient first name", "patient name"],
-        "patientmiddleinitial": ["middle initial", "mi", "middle name", "patient middle initial"],
-        "patientlastname": ["last name", "lastname", "lname", "patient last name", "surname"],
-        "dateofbirth": ["dob", "birth date", "birthdate", "date of birth", "patient date of birth"],
-        "gender": ["sex", "patient gender", "patient sex"],
-        "race": ["ethnicity", "patient race", "patient ethnicity"],
-        "maritalstatus": ["marital status", "status", "patient marital status"],
-        "language": ["preferred language", "patient language", "language preference"],
-        "socialsecuritynumber": ["ssn", "social security no", "social security number", "social security"],
-        
-        # Contact information
-        "addressstreet": ["address", "street address", "street", "patient address", "patient address street"],
-        "addresscity": ["city", "town", "patient city", "patient address city"],
-        "addressstate": ["state", "province", "patient state", "patient address state"],
-        "addresszipcode": ["zip", "zipcode", "zip code", "postal code", "patient zip", "patient address zip code"],
-        "hometelephone": ["home phone", "telephone", "home tel", "home telephone"],
-        "worktelephone": ["work phone", "business phone", "office phone", "work tel", "work telephone"],
-        "celltelephone": ["cell phone", "mobile", "mobile phone", "cell", "cellular", "cell telephone"],
-        "email": ["email address", "e-mail", "patient email"],
-        
-        # Emergency contact
-        "emergencycontactname": ["emergency contact", "emergency name", "emergency contact person", "emergency contact name"],
-        "emergencycontactrelationship": ["emergency relationship", "emergency contact relation", "relation to patient", "emergency contact relationship"],
-        "emergencycontacttelephone": ["emergency phone", "emergency tel", "emergency contact phone", "emergency contact tel", "emergency contact telephone"],
-        
-        # Employment
-        "employmentstatus": ["employment", "employment type", "work status"],
-        "occupation": ["job", "position", "profession"],
-        "industry": ["sector", "field", "business sector"],
-        "companyname": ["employer", "company", "business name", "place of employment", "employer name"],
-        "companyaddressstreet": ["company street", "employer address", "business address", "company address", "company address street"],
-        "companyaddresscity": ["company city", "employer city", "business city", "company address city"],
-        "companyaddressstate": ["company state", "employer state", "business state", "company address state"],
-        "companyaddresszipcode": ["company zip", "employer zip", "business zip", "company address zip", "company address zip code"],
-        
-        # Insurance
-        "insuranceprovider": ["insurance company", "insurer", "insurance", "insurance carrier", "insurance provider"],
-        "patientgroupnumber": ["group number", "group no", "group", "insurance group", "patient group number"],
-        "policynumber": ["policy no", "policy", "insurance policy", "policy id", "policy number"],
-        "patientsubscriberid": ["subscriber id", "member id", "insurance id", "patient id", "patient subscriber id"],
-        "typeofinsurance": ["insurance type", "plan type", "coverage type", "type of insurance"],
-        "insurancetelephone": ["insurance phone", "insurer phone", "insurance tel", "insurance telephone"],
-        "subscribername": ["subscriber", "policy holder", "insurance holder", "subscriber name"],
-        
-        # Medical
-        "allergies": ["patient allergies", "known allergies", "allergy list", "allergic to"],
-        "reasonforvisit": ["chief complaint", "reason", "symptoms", "reason for visit"],
-        "primarycarephysicianname": ["pcp", "primary doctor", "doctor name", "physician", "primary care physician", "primary care physician name"],
-        "primarycarephysicianaddressstreet": ["doctor address", "physician address", "pcp address", "primary care physician address", "primary care physician address street"],
-        "primarycarephysicianaddresscity": ["doctor city", "physician city", "pcp city", "primary care physician address city"],
-        "primarycarephysicianaddressstate": ["doctor state", "physician state", "pcp state", "primary care physician address state"],
-        "primarycarephysicianaddresszipcode": ["doctor zip", "physician zip", "pcp zip", "primary care physician address zip", "primary care physician address zip code"],
-        
-        # Appointment
-        "desiredappointmentdate1": ["appointment date", "appt date", "preferred date", "desired appointment date"],
-        "desiredappointmenttime1": ["appointment time", "appt time", "preferred time", "desired appointment time"],
-        "desiredappointmentdate2": ["alternate date", "second date", "backup date", "desired appointment date 2"],
-        "desiredappointmenttime2": ["alternate time", "second time", "backup time", "desired appointment time 2"],
-        
-        # Signature fields
-        "date": ["signature date", "today's date", "form date"],
-        "signature": ["patient signature", "signature of patient", "signature"]
-    }
-    
-    # Create normalized versions of label_coords keys
-    normalized_labels = {}
-    for label in label_coords:
-        # Remove punctuation, lowercase, and remove whitespace
-        normalized = ''.join(e.lower() for e in label if e.isalnum())
-        normalized_labels[normalized] = label
     
     # Function to flatten nested JSON
     def flatten_json(nested_json, prefix=''):
@@ -301,50 +229,26 @@ def normalize_and_match_fields(json_data, label_coords):
     # Flatten the JSON data
     flattened_json = flatten_json(json_data)
     
-    # Create a mapping between normalized JSON keys and their original values
+    # Index the JSON values by normalized key and by canonical field (first key wins); a
+    # generic profile key like "status" doesn't say which form field it belongs to
     json_mapping = {}
+    json_by_field = {}
     for key, value in flattened_json.items():
-        normalized_key = ''.join(e.lower() for e in key if e.isalnum())
-        json_mapping[normalized_key] = value
+        json_mapping.setdefault(normalize_key(key), value)
+        canonical = canonical_field(key, generic=False)
+        if canonical:
+            json_by_field.setdefault(canonical, value)
     
-    # Match fields using the variation mappings
+    # Match each form label: direct normalized match first, then through its canonical field
     matched_fields = {}
-    
-    # First try direct matches
-    for json_key_norm, value in json_mapping.items():
-        if json_key_norm in normalized_labels:
-            original_label = normalized_labels[json_key_norm]
-            matched_fields[original_label] = value
-    
-    # Then try finding variations
-    for standard_key, variations in field_variations.items():
-        # If we already have this field, skip
-        if any(standard_key == ''.join(e.lower() for e in k if e.isalnum()) for k in matched_fields):
-            continue
-            
-        # Try to find a match using variations
-        for variation in variations:
-            variation_norm = ''.join(e.lower() for e in variation if e.isalnum())
-            
-            # Check if this variation exists in the form labels
-            if variation_norm in normalized_labels:
-                original_label = normalized_labels[variation_norm]
-                
-                # Find the value in the JSON data
-                if standard_key in json_mapping:
-                    matched_fields[original_label] = json_mapping[standard_key]
-                    break
-                    
-                # Try variations in the JSON too
-                for json_key_norm, value in json_mapping.items():
-                    if json_key_norm == standard_key or json_key_norm in variations:
-                        matched_fields[original_label] = value
-                        break
-    
-    # Add any unmatched but recognized form fields with empty values
     for label in label_coords:
-        if label not in matched_fields:
-            matched_fields[label] = ""
+        label_norm = normalize_key(label)
+        if label_norm in json_mapping:
+            matched_fields[label] = json_mapping[label_norm]
+            continue
+        canonical = canonical_field(label)
+        # Add any unmatched but recognized form fields with empty values
+        matched_fields[label] = json_by_field.get(canonical, "") if canonical else ""
     
     return matched_fields
 
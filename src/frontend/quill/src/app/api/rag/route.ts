@@ -61,6 +61,48 @@ async function runPythonScript(scriptPath: string, args: string[]) {
   }
 }
 
+/**
+ * Convert CLI-style arguments (e.g. ['--mode', 'query', '--question', '...'])
+ * into the JSON payload accepted by the RAG server.
+ */
+function argsToPayload(args: string[]): { mode: string; payload: Record<string, string> } {
+  const payload: Record<string, string> = {};
+  let mode = '';
+  for (let i = 0; i < args.length - 1; i += 2) {
+    const key = args[i].replace(/^--/, '').replace(/-/g, '_');
+    if (key === 'mode') {
+      mode = args[i + 1];
+    } else {
+      payload[key] = args[i + 1];
+    }
+  }
+  return { mode, payload };
+}
+
+/**
+ * Run a RAG request against the long-lived server started with
+ * `python3 quill_rag_v4.py --mode serve` when QUILL_RAG_URL is set,
+ * falling back to spawning the script for each request.
+ */
+async function runRagScript(scriptPath: string, args: string[]) {
+  const serverUrl = process.env.QUILL_RAG_URL;
+  if (serverUrl) {
+    const { mode, payload } = argsToPayload(args);
+    try {
+      const response = await fetch(`${serverUrl.replace(/\/$/, '')}/${mode}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+      });
+      // Return the body as stdout so callers parse it exactly like script output
+      return { stdout: await response.text(), stderr: '' };
+    } catch (error) {
+      console.error('RAG server unavailable, falling back to script:', error);
+    }
+  }
+  return runPythonScript(scriptPath, args);
+}
+
 /**
  * Simple sentiment classifier to detect if a message is requesting an update to user information
  * @param message The user's message
@@ -150,7 +192,7 @@ export async function POST(request: Request) {
       const buffer = Buffer.from(await file.arrayBuffer());
       const filePath = await saveUploadedFile(buffer, file.name);
 
-      const { stdout } = await runPythonScript(
+      const { stdout } = await runRagScript(
         ragScriptPath,
         ['--mode', 'ingest', '--document', filePath]
       );
@@ -201,7 +243,7 @@ export async function POST(request: Request) {
         args.push('--chat-history', tempChatHistoryPath);
       }
 
-      const { stdout } = await runPythonScript(ragScriptPath, args);
+      const { stdout } = await runRagScript(ragScriptPath, args);
 
       try {
         const result = JSON.parse(stdout);
@@ -240,7 +282,7 @@ export async function POST(request: Request) {
     
       const questionPrompt = `You are a helpful, form-filling assistant. The user will provide you with an image of a blank or partially-filled form. For each field, your task is to generate the answer to the question, 'What is the value of the field?' and add the field label and its answer as a key-value pair to a .JSON file. If the answer to the field is not already in the form, check if you can find the answer in the chat history. Here is an example response: ${sample_json} ONLY RESPOND WITH THE OUTPUT OF A .JSON FILE WITH NO ADDITIONAL TEXT`;
     
-      const fields = await runPythonScript(
+      const fields = await runRagScript(
         ragScriptPath,
         ['--mode', 'query', '--document', filePath, '--question', questionPrompt]);
     
@@ -1,8 +1,11 @@
+import os
 import sys
-import ollama
 from spire.pdf.common import *
 from spire.pdf import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import get_client
+
 # System prompt defining the assistant's persona and behavior
 SYSTEM_PROMPT = """You are Quill, a friendly and efficient document assistant. 
 
@@ -43,9 +46,9 @@ def PDF2IMG(doc):
 def extract_fields(doc):
     imgs = PDF2IMG(doc)
     print(imgs)
-    response = ollama.chat(
-    model='llama3.2-vision:11b',
-    messages=[{
+    # No deadline, as with ollama.chat: a cold model can take minutes to answer
+    response = get_client("ollama", "llama3.2-vision:11b", timeout=0).chat(
+    [{
         'role': 'system',
         'content': SYSTEM_PROMPT,
     }, {
@@ -56,7 +59,7 @@ def extract_fields(doc):
     )
     
     # Print response
-    print(response['message']['content'])
+    print(response.content)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -1,8 +1,11 @@
+import os
 import sys
-import ollama
 from spire.pdf.common import *
 from spire.pdf import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import get_client
+
 # System prompt defining the assistant's persona and behavior
 SYSTEM_PROMPT = """You are Quill, a friendly and efficient document assistant. 
 
@@ -43,9 +46,9 @@ def PDF2IMG(doc):
 
 def send_query(message):
     # imgs = [PDF2IMG(doc) for doc in docs]
-    response = ollama.chat(
-        'llama3.2-vision:11b',
-        messages=[
+    # No deadline, as with ollama.chat: a cold model can take minutes to answer
+    response = get_client("ollama", "llama3.2-vision:11b", timeout=0).chat(
+        [
             {
                 'role': 'system',
                 'content': SYSTEM_PROMPT
@@ -56,16 +59,14 @@ def send_query(message):
                 # 'images': imgs
             },
         ],
-        options={
-            'temperature': 0.7,
-            'top_k': 50,
-            'top_p': 0.9,
-            'max_tokens': 100
-        }
+        temperature=0.7,
+        top_k=50,
+        top_p=0.9,
+        max_tokens=100
     )
     
     # Clean and print the response
-    print(response['message']['content'])
+    print(response.content)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -1,16 +1,18 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
+import os
 import json
 import re
 import logging
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import get_client
+
 def extract_key_value_info(url):
     """
     Use o3-mini to visit a URL and extract key-value pairs from an online form.
     Returns the data in JSON format.
     """
-    llm = ChatOpenAI(model_name="o3-mini", temperature=0)
+    llm = get_client("openai", "o3-mini", temperature=0)
 
     prompt = (
         f"Visit this URL: {url}\n\n"
@@ -1,3 +1,5 @@
+import os
+import sys
 import time
 import re
 import logging
@@ -8,54 +10,42 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import pytesseract
 from PIL import Image
-import openai
 import pdfplumber
 import fitz
 
-openai.api_key = OPEN_AI_KEY
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.field_schema import best_field
+from common.llm_client import get_client
+
+llm_client = get_client("openai", "gpt-3.5-turbo", api_key=OPEN_AI_KEY)
 SURVEY_MONKEY = "https://www.surveymonkey.com/r/WYCHJ7P"
 GOOGLE_FORM = "https://forms.gle/KBzBQVgSYcA28BKj6"
 TYPE_FORM = "https://form.typeform.com/to/mwWgVg29"
 JOT_FORM = "https://form.jotform.com/250685379571166"
 HTML_FORM = "http://localhost:63342/discord_agent/discord_agent/src/form1.html?_ijt=nrbddslpgrdho7hpi8lgi0t9h5"
 
+# Canonical fields (see common/field_schema.py) read back from a filled form
+PARSED_FIELDS = {
+    "last_name", "first_name", "middle_initial", "dob", "gender", "marital_status",
+    "address", "city", "state", "zip_code", "home_phone", "cell_phone",
+    "pcp", "pcp_address", "insurance_provider", "policy_number", "ssn",
+    "occupation", "company_name", "company_address",
+}
+
 def clean_field_name(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
 def parse_extracted_text(text):
     extracted_data = {}
-    field_mappings = {
-        "Last Name": "last_name",
-        "First Name": "first_name",
-        "Middle Initial": "middle_initial",
-        "Date of Birth": "dob",
-        "Gender": "gender",
-        "Marital Status": "marital_status",
-        "Patient Address": "address",
-        "City": "city",
-        "State": "state",
-        "Zip Code": "zip_code",
-        "Home Telephone": "home_phone",
-        "Cell Telephone": "cell_phone",
-        "Primary Care Physician": "pcp",
-        "Physician Address": "pcp_address",
-        "Insurance Provider": "insurance_provider",
-        "Policy Number": "policy_number",
-        "Social Security Number": "ssn",
-        "Occupation": "occupation",
-        "Company Name": "company_name",
-        "Company Address": "company_address"
-    }
-
     lines = text.split("\n")
     for i in range(len(lines) - 1):
         field_name = clean_field_name(lines[i])
         field_value = clean_field_name(lines[i + 1])
-        for key in field_mappings:
-            if key in field_name:
-                extracted_data[field_mappings[key]] = field_value
-                break  # Ensures only the first matching field is used
+        # Longest field alias in the line, found in one pass over its words
+        field = best_field(field_name)
+        if field in PARSED_FIELDS:
+            extracted_data[field] = field_value
 
     return extracted_data
 
@@ -112,11 +102,8 @@ def review_and_edit_data(extracted_screenshot_data, extracted_form_fields):
         else:
             user_prompt = f"The web form requires '{field}', but it was not found in the screenshot. What should we enter?"
         conversation_history.append({"role": "user", "content": user_prompt})
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=conversation_history
-        )
-        assistant_reply = response["choices"][0]["message"]["content"].strip()
+        response = llm_client.chat(conversation_history)
+        assistant_reply = response.content.strip()
         print(assistant_reply)
         user_input = input(f"Your response for {field}: ")
         extracted_screenshot_data[field] = user_input
@@ -0,0 +1,34 @@
+"""
+Field label detection for the online form fillers: picks the lines of a form's OCR'd text
+that name one of the profile fields Quill can fill.
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.field_schema import find_fields
+
+# Canonical fields (see common/field_schema.py) that mark a line as a form field
+FORM_FIELDS = {
+    "full_name", "first_name", "last_name", "address", "city", "state", "zip_code", "country",
+    "phone", "cell_phone", "email", "dob", "ssn", "university", "student_id", "major", "grade",
+    "injury_description", "signature",
+}
+
+def clean_field_name(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
+    return text
+
+def detect_form_fields(text):
+    """Cleaned lines of text that mention a FORM_FIELDS alias, in order and without repeats."""
+    fields = []
+    seen_fields = set()
+    for line in text.split("\n"):
+        line = clean_field_name(line)
+        # One pass over the line's words finds every field alias it mentions
+        if line not in seen_fields and any(field in FORM_FIELDS for _, _, field in find_fields(line)):
+            fields.append(line)
+            seen_fields.add(line)
+    return fields
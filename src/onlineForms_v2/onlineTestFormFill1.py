@@ -1,5 +1,6 @@
+import os
+import sys
 import time
-import re
 import logging
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -8,21 +9,19 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import pytesseract
 from PIL import Image
-import openai
 import pdfplumber
 
-openai.api_key = OPEN_AI_KEY
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm_client import get_client
+from form_fields import clean_field_name, detect_form_fields
+
+llm_client = get_client("openai", "gpt-3.5-turbo", api_key=OPEN_AI_KEY)
 SURVEY_MONKEY = "https://www.surveymonkey.com/r/WYCHJ7P"
 GOOGLE_FORM = "https://forms.gle/KBzBQVgSYcA28BKj6"
 TYPE_FORM = "https://form.typeform.com/to/mwWgVg29"
 JOT_FORM = "https://form.jotform.com/250685379571166"
 HTML_FORM = "http://localhost:63342/discord_agent/discord_agent/src/form1.html?_ijt=nrbddslpgrdho7hpi8lgi0t9h5"
 
-def clean_field_name(text):
-    text = re.sub(r'\s+', ' ', text).strip()
-    text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
-    return text
-
 def extract_text_from_pdf(pdf_path):
     extracted_data = {}
     with pdfplumber.open(pdf_path) as pdf:
@@ -55,27 +54,7 @@ def extract_form_fields(form_url):
         image = Image.open(screenshot_path)
         extracted_text += pytesseract.image_to_string(image) + "\n"
     driver.quit()
-    field_patterns = [
-        r"(name|full name|first name|last name)",
-        r"(Address|address|city|state|zip code|postal code|country)",
-        r"(phone number|mobile number|contact number)",
-        r"(email|email address)",
-        r"(date of birth|dob|birthdate)",
-        r"(social security number|ssn)",
-        r"(university|Stanford ID|ID|college)",
-        r"(major|Major|Field of study)",
-        r"(grade|class)",
-        r"(Injury Description|Injury)",
-        r"(E-Signature|Signature)",
-    ]
-    fields = []
-    seen_fields = set()
-    for line in extracted_text.split("\n"):
-        line = clean_field_name(line)
-        if any(re.search(pattern, line, re.IGNORECASE) for pattern in field_patterns) and line not in seen_fields:
-            fields.append(line)
-            seen_fields.add(line)
-    return fields
+    return detect_form_fields(extracted_text)
 
 def chat_with_user_gpt(form_fields):
     user_responses = {}
@@ -94,11 +73,8 @@ def chat_with_user_gpt(form_fields):
     for field in form_fields:
         user_prompt = f"Field detected: {field}"
         conversation_history.append({"role": "user", "content": user_prompt})
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=conversation_history
-        )
-        assistant_reply = response["choices"][0]["message"]["content"].strip()
+        response = llm_client.chat(conversation_history)
+        assistant_reply = response.content.strip()
         print(assistant_reply)
         user_input = input("Your response: ")
         user_responses[field] = user_input
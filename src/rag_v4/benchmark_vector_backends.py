@@ -0,0 +1,147 @@
+"""
+Compare the Chroma and NumPy vector store backends used by quill_rag_v4.py.
+Builds a store of synthetic embeddings for each backend, then reopens it in a fresh
+Python process to time a cold load (imports included), per-query top-k latency and
+ingesting one more document the way quill_rag_v4.py does: a few chunks per page, with
+one persist at the end of the document.
+
+Usage: python3 benchmark_vector_backends.py --chunks 3000 --dim 768 --queries 200 --ingest-pages 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from vector_store import VECTOR_BACKENDS, open_document_store
+
+
+def random_vectors(count, dim, seed):
+    rng = random.Random(seed)
+    return [[rng.gauss(0.0, 1.0) for _ in range(dim)] for _ in range(count)]
+
+
+def build_store(backend, vector_db_dir, chunks, dim, docs):
+    """Fill a new store with synthetic chunks spread over docs documents; return seconds taken."""
+    store = open_document_store(backend, vector_db_dir, None)
+    vectors = random_vectors(chunks, dim, seed=0)
+    start = time.perf_counter()
+    for doc in range(docs):
+        rows = range(doc, chunks, docs)
+        doc_id = f"doc{doc}"
+        store.add_embedded(
+            [f"{doc_id}:{row}" for row in rows],
+            [vectors[row] for row in rows],
+            [f"chunk {row}" for row in rows],
+            [{"doc_id": doc_id, "source": doc_id, "page": 1} for _ in rows],
+        )
+    store.persist()
+    return time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure_incremental_ingest(store, dim, pages, page_chunks):
+    """Add one document to an open store page by page, persisting once; return seconds taken."""
+    vectors = random_vectors(pages * page_chunks, dim, seed=2)
+    doc_id = "ingested"
+    start = time.perf_counter()
+    for page in range(pages):
+        rows = range(page * page_chunks, (page + 1) * page_chunks)
+        store.add_embedded(
+            [f"{doc_id}:{row}" for row in rows],
+            [vectors[row] for row in rows],
+            [f"chunk {row}" for row in rows],
+            [{"doc_id": doc_id, "source": doc_id, "page": page + 1} for _ in rows],
+        )
+    store.persist()
+    return time.perf_counter() - start
+
+
+def measure_load_and_query(backend, vector_db_dir, dim, queries, k, pages, page_chunks):
+    """
+    Run in a fresh process: time opening the store, answering queries one at a time and
+    then ingesting a document of pages * page_chunks chunks into it.
+    """
+    start = time.perf_counter()
+    store = open_document_store(backend, vector_db_dir, None)
+    store.count()
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for vector in random_vectors(queries, dim, seed=1):
+        query_start = time.perf_counter()
+        store.search([vector], k)
+        latencies.append(time.perf_counter() - query_start)
+
+    ingest_seconds = measure_incremental_ingest(store, dim, pages, page_chunks) if pages else 0.0
+
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "query_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "query_p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "query_mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "ingest_seconds": round(ingest_seconds, 4),
+        "ingest_page_ms": round(ingest_seconds / pages * 1000, 3) if pages else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store backends on load time and query latency.")
+    parser.add_argument("--backends", nargs="+", choices=sorted(VECTOR_BACKENDS), default=sorted(VECTOR_BACKENDS))
+    parser.add_argument("--chunks", type=int, default=3000, help="Number of stored chunks")
+    parser.add_argument("--docs", type=int, default=20, help="Number of documents the chunks are spread over")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (nomic-embed-text is 768)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=4, help="Results per query")
+    parser.add_argument("--ingest-pages", type=int, default=50,
+                        help="Pages in the document ingested after the queries (0 to skip)")
+    parser.add_argument("--page-chunks", type=int, default=3, help="Chunks added per ingested page")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)   # internal: backend,vector_db_dir
+    args = parser.parse_args()
+
+    if args.measure:
+        backend, vector_db_dir = args.measure.split(",", 1)
+        print(json.dumps(measure_load_and_query(backend, vector_db_dir, args.dim, args.queries, args.k,
+                                                args.ingest_pages, args.page_chunks)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        vector_db_dir = tempfile.mkdtemp(prefix=f"quill_bench_{backend}_")
+        try:
+            build_seconds = build_store(backend, vector_db_dir, args.chunks, args.dim, args.docs)
+            # A fresh interpreter so load time includes the backend's imports, as in a CLI run
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 "--measure", f"{backend},{vector_db_dir}",
+                 "--dim", str(args.dim), "--queries", str(args.queries), "--k", str(args.k),
+                 "--ingest-pages", str(args.ingest_pages), "--page-chunks", str(args.page_chunks)],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            results[backend] = dict(json.loads(output.strip().splitlines()[-1]),
+                                    build_seconds=round(build_seconds, 4))
+        finally:
+            shutil.rmtree(vector_db_dir, ignore_errors=True)
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "queries": args.queries,
+        "k": args.k,
+        "ingest_pages": args.ingest_pages,
+        "page_chunks": args.page_chunks,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Small SQLite-backed key/value cache with size-bounded LRU eviction and optional TTL.
+Used by quill_rag_v4.py to keep OCR output, LLM responses and embeddings between runs.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+
+def hash_file(file_path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(*parts):
+    """Return the SHA-256 hex digest of one or more strings joined with a separator."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent cache of bytes/str values keyed by string.
+    Entries are evicted least-recently-used first once the stored values exceed max_bytes,
+    and treated as missing once older than ttl_seconds (if set).
+    Safe to share between threads and between processes using the same file.
+    """
+
+    def __init__(self, path, max_bytes, ttl_seconds=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Return the cached value for key, or None, and mark it as recently used."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value):
+        """Store value (bytes or str) under key, evicting old entries if over budget."""
+        size = len(value.encode("utf-8") if isinstance(value, str) else value)
+        if size > self.max_bytes:
+            logging.warning(f"Not caching {key}: {size} bytes exceeds cache limit of {self.max_bytes}")
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached, marking them as recently used."""
+        found = {}
+        now = time.time()
+        keys = list(dict.fromkeys(keys))
+        with self._lock, self._connect() as conn:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                        continue
+                    found[key] = value
+            conn.executemany(
+                "UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+            )
+        return found
+
+    def set_many(self, items):
+        """Store several {key: value} pairs in one transaction, evicting old entries if over budget."""
+        rows = []
+        now = time.time()
+        for key, value in items.items():
+            size = len(value.encode("utf-8") if isinstance(value, str) else value)
+            if size <= self.max_bytes:
+                rows.append((key, value, size, now, now))
+        if not rows:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} entries from {self.path}")
+
+    def stats(self):
+        """Return entry count, stored bytes and limits for this cache."""
+        with self._lock, self._connect() as conn:
+            count, total, oldest, newest = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(last_access), MAX(last_access) FROM entries"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "oldest_access": oldest,
+            "newest_access": newest,
+        }
+
+    def purge(self, prefix=None):
+        """Delete every entry (or only keys starting with prefix); return how many were removed."""
+        with self._lock, self._connect() as conn:
+            if prefix:
+                cursor = conn.execute(
+                    "DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                )
+            else:
+                cursor = conn.execute("DELETE FROM entries")
+            removed = cursor.rowcount
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return removed
@@ -0,0 +1,97 @@
+"""
+SQLite registry of the documents ingested into the shared vector store.
+Keeps one row per doc_id with its content hash, collection, chunk and page counts,
+ingest time and status, so listing and deduplicating uploads are indexed lookups
+rather than scans of user_info.json.
+"""
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DOCUMENT_FIELDS = ("doc_id", "content_hash", "collection", "source", "chunk_count",
+                   "page_count", "ingested_at", "status")
+
+
+class DocumentRegistry:
+    """Table of ingested documents keyed by doc_id, with an index on content_hash."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " doc_id TEXT PRIMARY KEY,"
+                " content_hash TEXT,"
+                " collection TEXT,"
+                " source TEXT,"
+                " chunk_count INTEGER NOT NULL DEFAULT 0,"
+                " page_count INTEGER NOT NULL DEFAULT 0,"
+                " ingested_at REAL NOT NULL,"
+                " status TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, doc_id, **fields):
+        """
+        Insert or update doc_id's row. ingested_at defaults to now when the row is inserted;
+        updates only change the fields passed, so status changes keep the original time.
+        """
+        unknown = set(fields) - set(DOCUMENT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown document fields: {sorted(unknown)}")
+        inserted = dict(fields)
+        inserted.setdefault("ingested_at", time.time())
+        columns = ["doc_id"] + list(inserted)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                f" ON CONFLICT(doc_id) DO UPDATE SET {updates}",
+                [doc_id] + list(inserted.values()),
+            )
+
+    def get(self, doc_id):
+        """Return doc_id's row as a dict, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, content_hash, status=None):
+        """Return documents with the given content hash (optionally only with status)."""
+        query = "SELECT * FROM documents WHERE content_hash = ?"
+        params = [content_hash]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        with self._lock, self._connect() as conn:
+            return [dict(row) for row in conn.execute(query + " ORDER BY ingested_at", params)]
+
+    def list(self, status=None):
+        """Return every registered document, most recently ingested first."""
+        query = "SELECT * FROM documents"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        with self._lock, self._connect() as conn:
+            return [dict(row) for row in conn.execute(query + " ORDER BY ingested_at DESC", params)]
+
+    def delete(self, doc_id):
+        """Remove doc_id's row; returns True if it existed."""
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount > 0
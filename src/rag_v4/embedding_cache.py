@@ -0,0 +1,169 @@
+"""
+Persistent embedding cache for quill_rag_v4.py.
+Wraps an embeddings client (e.g. OllamaEmbeddings) so each distinct chunk text is only
+embedded once per model; vectors are stored in a DiskCache as packed float32 arrays.
+Cache misses are sent to the wrapped client in fixed-size batches from a small thread pool,
+with bounded in-flight batches and retries on transient errors.
+"""
+import time
+import logging
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from disk_cache import hash_text
+
+
+def pack_vector(vector):
+    """Pack a list of floats into compact float32 bytes."""
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(data):
+    """Unpack float32 bytes back into a list of floats."""
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+def is_transient_error(error):
+    """Connection drops, timeouts and 429/5xx responses are worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # httpx (used by the ollama client) raises TransportError subclasses for network failures
+    if any(cls.__name__ == "TransportError" for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in (429, 500, 502, 503, 504)
+
+
+class CachedEmbeddings:
+    """
+    Embeddings client that looks up each text in a DiskCache before calling the wrapped client.
+    Implements the embed_documents/embed_query interface expected by langchain vector stores.
+    """
+
+    def __init__(self, embeddings, cache, model_name, batch_size=32, workers=1,
+                 max_retries=3, retry_backoff_seconds=0.5):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+        self.batch_size = max(batch_size, 1)
+        self.workers = max(workers, 1)
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self.embed_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def cache_key(self, text):
+        return hash_text("embedding", self.model_name, text)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self.cache_key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct uncached text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            start = time.perf_counter()
+            new_entries = {}
+            for batch_keys, vectors in self._embed_batches(list(missing.items())):
+                batch_entries = {key: pack_vector(vector) for key, vector in zip(batch_keys, vectors)}
+                self.cache.set_many(batch_entries)
+                new_entries.update(batch_entries)
+            cached.update(new_entries)
+            with self._stats_lock:
+                self.embed_seconds += time.perf_counter() - start
+
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        logging.info(f"Embedded {len(texts)} texts ({len(texts) - len(missing)} from cache)")
+        return [unpack_vector(cached[key]) for key in keys]
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            return self._pool
+
+    def _embed_with_retries(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_error(e):
+                    raise
+                delay = self.retry_backoff_seconds * (2 ** attempt)
+                logging.warning(f"Embedding batch of {len(texts)} failed ({e}); retrying in {delay:.1f}s")
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    def _embed_batches(self, items):
+        """
+        Yield (keys, vectors) per batch of (key, text) items in input order. At most two batches
+        per worker are queued or running at once so a large document can't flood the server.
+        """
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        if self.workers == 1 or len(batches) == 1:
+            for batch in batches:
+                yield [key for key, _ in batch], self._embed_with_retries([text for _, text in batch])
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        for batch in batches:
+            if len(pending) >= self.workers * 2:
+                keys, future = pending.popleft()
+                yield keys, future.result()
+            texts = [text for _, text in batch]
+            pending.append(([key for key, _ in batch], pool.submit(self._embed_with_retries, texts)))
+        while pending:
+            keys, future = pending.popleft()
+            yield keys, future.result()
+
+    def embed_query(self, text):
+        key = self.cache_key(text)
+        data = self.cache.get(key)
+        if data is not None:
+            with self._stats_lock:
+                self.hits += 1
+            return unpack_vector(data)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                vector = self.embeddings.embed_query(text)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_error(e):
+                    raise
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(self.retry_backoff_seconds * (2 ** attempt))
+        self.cache.set(key, pack_vector(vector))
+        with self._stats_lock:
+            self.misses += 1
+        return vector
+
+    def stats(self):
+        """Return cache hits/misses, retries and time spent embedding since this client was created."""
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "retries": self.retries,
+                "embed_seconds": self.embed_seconds,
+            }
@@ -0,0 +1,143 @@
+"""
+BM25 keyword index over the chunks in the shared vector store, built on SQLite FTS5.
+Dense embeddings blur exact identifiers (SSNs, EINs, policy numbers, ZIP codes); this
+index matches them token for token. Hyphenated tokens are kept whole, and a second
+column holds digits-only forms of number-like runs so "123-45-6789", "123 45 6789"
+and "123456789" all match each other.
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+QUERY_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]*")
+NUMBER_RUN_PATTERN = re.compile(r"\d[\d\s\-./]*\d")
+MIN_DIGITS = 4                   # Shorter numbers (dates, line numbers) are too ambiguous to normalize
+MAX_QUERY_TERMS = 32
+STOPWORDS = {"a", "an", "and", "the", "of", "or", "to", "in", "on", "for", "if", "is", "your", "you", "my", "what"}
+
+
+def number_forms(text):
+    """Digits-only forms of the number-like runs in text, e.g. '123-45-6789' -> '123456789'."""
+    forms = []
+    for run in NUMBER_RUN_PATTERN.findall(text):
+        digits = re.sub(r"\D", "", run)
+        if len(digits) >= MIN_DIGITS:
+            forms.append(digits)
+    return forms
+
+
+def quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_query(query):
+    """FTS5 MATCH expression ORing the query's words and the digits-only forms of its numbers."""
+    terms = []
+    for token in QUERY_TOKEN_PATTERN.findall(query.lower()):
+        token = token.strip("-")
+        if token and token not in STOPWORDS and f"text:{quote(token)}" not in terms:
+            terms.append(f"text:{quote(token)}")
+    for digits in number_forms(query):
+        if f"digits:{quote(digits)}" not in terms:
+            terms.append(f"digits:{quote(digits)}")
+    return " OR ".join(terms[:MAX_QUERY_TERMS])
+
+
+class LexicalIndex:
+    """FTS5 table of chunk texts (with ids, doc_ids and metadata) ranked with BM25."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                " chunk_id UNINDEXED, doc_id UNINDEXED, metadata UNINDEXED, text, digits,"
+                " tokenize = \"unicode61 tokenchars '-'\")"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert(conn, ids, texts, metadatas):
+        rows = [
+            (chunk_id, meta.get("doc_id"), json.dumps(meta), text, " ".join(number_forms(text)))
+            for chunk_id, text, meta in zip(ids, texts, metadatas)
+        ]
+        conn.executemany(
+            "INSERT INTO chunks (chunk_id, doc_id, metadata, text, digits) VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+    def add_chunks(self, ids, texts, metadatas):
+        """Index chunks by id; metadatas must include each chunk's doc_id."""
+        with self._lock, self._connect() as conn:
+            self._insert(conn, ids, texts, metadatas)
+
+    def delete_chunks(self, ids):
+        """Remove chunks by id; returns how many were deleted."""
+        ids = list(ids)
+        deleted = 0
+        with self._lock, self._connect() as conn:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                deleted += conn.execute(
+                    f"DELETE FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).rowcount
+        return deleted
+
+    def rebuild(self, ids, texts, metadatas):
+        """
+        Replace the whole index with the given chunks and reclaim the space of the old ones.
+        The swap is one transaction, so concurrent rebuilds can't interleave into duplicate rows.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM chunks")
+            self._insert(conn, ids, texts, metadatas)
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO chunks (chunks) VALUES ('optimize')")
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+
+    def count(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query, k, doc_ids=None):
+        """
+        Best BM25 matches for a free-text query. Returns a list of
+        {"id", "text", "metadata", "score"} dicts, best first (higher score is better).
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+        sql = "SELECT chunk_id, text, metadata, bm25(chunks) FROM chunks WHERE chunks MATCH ?"
+        params = [match]
+        if doc_ids:
+            doc_ids = list(doc_ids)
+            sql += f" AND doc_id IN ({','.join('?' * len(doc_ids))})"
+            params.extend(doc_ids)
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        params.append(k)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        # FTS5's bm25() is negated so that ascending order puts the best match first
+        return [
+            {"id": chunk_id, "text": text, "metadata": json.loads(metadata), "score": -rank}
+            for chunk_id, text, metadata, rank in rows
+        ]
@@ -0,0 +1,229 @@
+"""
+Transactional store for the user's profile fields, backed by SQLite in WAL mode.
+Writers upsert individual fields inside an IMMEDIATE transaction, so concurrent ingest
+and update requests (including separate processes spawned by the Next.js API routes)
+never overwrite each other's fields, and readers always see a committed snapshot.
+After every write the full profile is exported atomically to user_info.json, which the
+frontend's user-info route still reads.
+Each field records where its value came from (a document or conversation turn), when, and
+the profile version that last changed it. The profile version increases by one for every
+write that changes anything, and a history table allows diffs against any earlier version.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class ProfileStore:
+    """Profile fields (key -> JSON value, with provenance) in SQLite, mirrored to a JSON export file."""
+
+    def __init__(self, path, export_path=None):
+        self.path = path
+        self.export_path = export_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fields ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " source TEXT,"
+                " version INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Stores created before provenance was tracked
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(fields)")}
+            if "source" not in columns:
+                conn.execute("ALTER TABLE fields ADD COLUMN source TEXT")
+            if "version" not in columns:
+                conn.execute("ALTER TABLE fields ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                " version INTEGER NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT,"
+                " source TEXT,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_version ON history (version)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('profile_version', 0)")
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None lets us issue BEGIN IMMEDIATE ourselves
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _write_transaction(self):
+        with self._lock, self._connect() as conn:
+            # Take the write lock up front so concurrent writers queue instead of failing mid-transaction
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _version(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'profile_version'").fetchone()[0]
+
+    def _bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'profile_version'")
+        return self._version(conn)
+
+    def _read_all(self, conn):
+        return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM fields ORDER BY rowid")}
+
+    def _get_in(self, conn, keys):
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value FROM fields WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def _export(self, conn):
+        """Atomically rewrite the JSON export from the current (uncommitted) profile."""
+        if not self.export_path:
+            return
+        os.makedirs(os.path.dirname(self.export_path) or ".", exist_ok=True)
+        tmp_path = f"{self.export_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._read_all(conn), f, indent=4)
+        os.replace(tmp_path, self.export_path)
+
+    def get_all(self):
+        """Return the whole profile as a dict."""
+        with self._connect() as conn:
+            return self._read_all(conn)
+
+    def version(self):
+        """Current profile version; it only increases, by one per write that changed a field."""
+        with self._connect() as conn:
+            return self._version(conn)
+
+    def get_with_provenance(self, keys=None):
+        """Return {key: {"value", "source", "updated_at", "version"}} for all (or the given) fields."""
+        query = "SELECT key, value, source, updated_at, version FROM fields"
+        params = []
+        if keys is not None:
+            params = list(keys)
+            if not params:
+                return {}
+            query += f" WHERE key IN ({','.join('?' * len(params))})"
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY rowid", params).fetchall()
+        return {
+            key: {"value": json.loads(value), "source": source, "updated_at": updated_at, "version": version}
+            for key, value, source, updated_at, version in rows
+        }
+
+    def upsert(self, fields, source=None):
+        """
+        Write the given fields in one transaction; other fields are untouched. Fields whose value
+        is unchanged are skipped. Returns {"version": profile version, "changed": {key: value}}.
+        """
+        now = time.time()
+        with self._write_transaction() as conn:
+            current = self._get_in(conn, fields)
+            changed = {key: value for key, value in fields.items()
+                       if key not in current or current[key] != value}
+            if not changed:
+                return {"version": self._version(conn), "changed": {}}
+
+            version = self._bump_version(conn)
+            rows = [(key, json.dumps(value), now, source, version) for key, value in changed.items()]
+            conn.executemany(
+                "INSERT INTO fields (key, value, updated_at, source, version) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at,"
+                " source = excluded.source, version = excluded.version",
+                rows,
+            )
+            conn.executemany(
+                "INSERT INTO history (key, value, updated_at, source, version) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            # Exported while still holding the write lock, so exports land in commit order
+            self._export(conn)
+        return {"version": version, "changed": changed}
+
+    def changes_since(self, version):
+        """
+        Fields changed after the given profile version, for callers holding a copy from then.
+        Returns {"version": current, "changed": {key: value}, "deleted": [keys]}.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, value FROM history WHERE version > ? ORDER BY version, rowid", (version,)
+            ).fetchall()
+            current = self._version(conn)
+        latest = dict(rows)
+        return {
+            "version": current,
+            "changed": {key: json.loads(value) for key, value in latest.items() if value is not None},
+            "deleted": sorted(key for key, value in latest.items() if value is None),
+        }
+
+    def field_history(self, key):
+        """Every recorded value of key, oldest first, with its source, timestamp and version."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT value, source, updated_at, version FROM history WHERE key = ? ORDER BY version",
+                (key,),
+            ).fetchall()
+        return [
+            {"value": None if value is None else json.loads(value), "source": source,
+             "updated_at": updated_at, "version": version}
+            for value, source, updated_at, version in rows
+        ]
+
+    def export(self):
+        """Rewrite the JSON export from the store (e.g. to drop entries the store never imported)."""
+        with self._write_transaction() as conn:
+            self._export(conn)
+
+    def import_json(self, json_file, transform=None):
+        """
+        Load fields from a legacy user_info.json into an empty store (a no-op once the store
+        has any fields). transform, if given, filters the loaded dict first. Returns fields imported.
+        """
+        if not os.path.exists(json_file):
+            return 0
+        try:
+            with open(json_file, "r") as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Error reading {json_file}: {e}")
+            return 0
+        if transform is not None:
+            legacy = transform(legacy)
+
+        now = time.time()
+        source = f"import:{os.path.basename(json_file)}"
+        with self._write_transaction() as conn:
+            if conn.execute("SELECT COUNT(*) FROM fields").fetchone()[0] or not legacy:
+                return 0
+            version = self._bump_version(conn)
+            rows = [(key, json.dumps(value), now, source, version) for key, value in legacy.items()]
+            conn.executemany(
+                "INSERT INTO fields (key, value, updated_at, source, version) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany(
+                "INSERT INTO history (key, value, updated_at, source, version) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._export(conn)
+        logging.info(f"Imported {len(legacy)} profile fields from {json_file}")
+        return len(legacy)
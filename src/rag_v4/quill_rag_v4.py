@@ -1,21 +1,30 @@
 import os
+import sys
 import json
 import re
+import time
 import logging
 import argparse
-from langchain_community.document_loaders import (
-    UnstructuredWordDocumentLoader,
-)
-from langchain.document_loaders.csv_loader import CSVLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_core.documents import Document
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_path
+import importlib
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from disk_cache import DiskCache, hash_file, hash_text
+from embedding_cache import CachedEmbeddings
+from document_registry import DocumentRegistry
+from lexical_index import LexicalIndex, STOPWORDS
+from profile_store import ProfileStore
+from vector_store import chunk_metadata, directory_size, migrate_per_document_stores, open_document_store
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.field_schema import FIELD_KIND_WORDS, canonical_field, describe_field_groups, field_group, normalize_key
 
-Image.MAX_IMAGE_PIXELS = None  # Disable image size limit
+# Heavy dependencies (langchain, Chroma, Tesseract, pdf2image, PIL) are imported
+# lazily through lazy_import() so each mode only pays for what it uses.
+_PROCESS_START = time.perf_counter()
+IMPORT_TIMINGS = {}
 
 # Configure logging
 logging.basicConfig(
@@ -24,14 +33,315 @@ logging.basicConfig(
 )
 
 # Constants
-VECTOR_DB_DIR = "vector_db"       # Base directory for persisting vector DBs
+VECTOR_DB_DIR = "vector_db"       # Base directory for the persisted vector store
+VECTOR_BACKEND = "chroma"         # "numpy" uses the in-process brute-force index instead
+DOCUMENT_REGISTRY_PATH = os.path.join(VECTOR_DB_DIR, "documents.sqlite3")
 MODEL_NAME = "llama3.2-vision:11b"
 EMBEDDING_MODEL = "nomic-embed-text"
+LLM_TIMEOUT_SECONDS = 300.0       # Deadline per chat request (long extraction prompts on a cold model)
+LLM_MAX_RETRIES = 2               # Retries per chat request on connection errors, 429 and 5xx
 USER_INFO_JSON = "../../uploads/user_info.json"
+TENANTS_DIR = "../../uploads/tenants"   # Per-user storage roots, sharded by a hash prefix of the user id
+TENANT_CACHE_SIZE = 32                  # Users whose stores stay open in serve mode; least recently used are evicted
+USER_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.@-]{0,127}")
+SERVE_HOST = "127.0.0.1"          # Serve mode only listens locally by default
+SERVE_PORT = 8765
+OCR_MODE = "fixed"                # "fixed" renders at OCR_DPI; "adaptive" escalates per page
+OCR_DPI = 900
+OCR_ADAPTIVE_DPIS = (300, 600, 900)   # DPI ladder tried in order by adaptive OCR
+OCR_CONFIDENCE_THRESHOLD = 80.0       # Mean word confidence needed to stop escalating
+OCR_MIN_WORDS = 3                     # Pages with fewer words than this at the lowest DPI are treated as blank
+MIN_TEXT_LAYER_CHARS = 20             # Pages with less embedded text than this are OCR'd
+CACHE_DIR = "cache"                   # Base directory for on-disk caches
+OCR_CACHE_PATH = os.path.join(CACHE_DIR, "ocr.sqlite3")
+OCR_CACHE_MAX_BYTES = 512 * 1024 * 1024
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm.sqlite3")
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60   # Cached responses expire after a week
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = 256 * 1024 * 1024   # ~85k nomic-embed-text vectors at float32
+EMBEDDING_BATCH_SIZE = 32                 # Chunks per embeddings request
+EMBEDDING_WORKERS = 2                     # Concurrent embeddings requests (see OLLAMA_NUM_PARALLEL)
+EMBEDDING_MAX_RETRIES = 3                 # Retries per batch on connection errors, 429 and 5xx
+EMBEDDING_RETRY_BACKOFF_SECONDS = 0.5     # Doubled after each retry
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 1000
+MIN_TEXT_OVERLAP = 50                     # Shortest suffix/prefix match trimmed when chunks have no offsets
+EXTRACTION_MODE = "map_reduce"            # "single" sends every chunk in one prompt
+EXTRACTION_TOKEN_BUDGET = 3000            # Approximate document tokens per map-reduce extraction call
+EXTRACTION_CONCURRENCY = 4                # Concurrent extraction calls (see OLLAMA_NUM_PARALLEL)
+LLM_SAMPLING_PARAMS = ("temperature", "top_k", "top_p", "num_predict", "num_ctx", "seed", "format")
+ANSWER_MODE = "retrieval"                 # "full" puts all of user_info in every query prompt
+RETRIEVAL_TOP_K = 4                       # Chunks fetched per question or form field
+RETRIEVAL_RANKING = "hybrid"              # "hybrid" fuses BM25 and vector ranks; "vector" uses embeddings only
+RRF_K = 60                                # Reciprocal rank fusion damping constant
+RETRIEVAL_MAX_QUERIES = 50                # Form lines searched per query request
+RETRIEVAL_MAX_CHUNKS = 12                 # Chunks kept in the prompt across all queries
+RETRIEVAL_PROFILE_FIELDS_PER_QUERY = 3    # Best-matching user_info fields per question or form field
+RETRIEVAL_MAX_PROFILE_FIELDS = 60         # user_info fields kept in the prompt across all queries
+OCR_WORKERS = os.cpu_count() or 1                 # OCR worker processes
+OCR_MAX_PAGES_IN_FLIGHT = OCR_WORKERS * 2         # Pages queued or rendered at any one time
+
+# Clients kept warm across requests in serve mode
+_llm = None
+_embeddings = None
+_default_tenant = None
+_tenants = OrderedDict()             # user_id -> TenantContext, least recently used first
+_tenant_lock = threading.Lock()
+# user_id -> write lock; shared by every live context of a user, so a request still holding an
+# evicted context and one using its replacement don't write to the same stores at once
+_tenant_write_locks = weakref.WeakValueDictionary()
+_ocr_pool = None
+_ocr_cache = None
+_llm_cache = None
+_embedding_cache = None
+_request_state = threading.local()   # Per-request tenant, LLM cache settings and hit/miss counters
+_llm_stats_lock = threading.Lock()
+_tesseract_version = None
+_ocr_pool_workers = None
+_client_lock = threading.Lock()
 
 
 ## Helper Functions
 
+def lazy_import(module_name):
+    """Import a module on first use and record how long the import took."""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMINGS[module_name] = round(time.perf_counter() - start, 4)
+
+    if module_name == "PIL.Image":
+        module.MAX_IMAGE_PIXELS = None  # Disable image size limit
+    return module
+
+def warm_imports():
+    """Import every optional dependency up front (used by serve mode)."""
+    for module_name in (
+        "common.llm_client",
+        "langchain_ollama",
+        "langchain_core.documents",
+        "langchain_text_splitters",
+        "langchain_community.vectorstores",
+        "langchain_community.document_loaders",
+        "langchain.document_loaders.csv_loader",
+        "pytesseract",
+        "PIL.Image",
+        "pdf2image",
+        "pdfplumber",
+        "numpy",
+    ):
+        try:
+            lazy_import(module_name)
+        except ImportError as e:
+            logging.warning(f"Could not preload {module_name}: {e}")
+
+def startup_report():
+    """Summarize per-import wall time and total time since the module started loading."""
+    return {
+        "imports": dict(sorted(IMPORT_TIMINGS.items(), key=lambda item: -item[1])),
+        "total_import_seconds": round(sum(IMPORT_TIMINGS.values()), 4),
+        "elapsed_seconds": round(time.perf_counter() - _PROCESS_START, 4),
+    }
+
+def get_llm():
+    """Return the shared chat model client, creating it on first use."""
+    global _llm
+    with _client_lock:
+        if _llm is None:
+            llm_client = lazy_import("common.llm_client")
+            _llm = llm_client.get_client(
+                "ollama", MODEL_NAME,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                temperature=0.3,
+            )
+        return _llm
+
+class TenantContext:
+    """
+    Storage paths of one user and their stores, opened on first use, plus the lock that
+    serializes the user's write requests (other users' writes don't wait on it).
+    user_id None is the original single-user layout (USER_INFO_JSON and VECTOR_DB_DIR).
+    Create contexts through get_tenant, which holds _tenant_lock.
+    """
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+        self.write_lock = _tenant_write_locks.setdefault(user_id, threading.Lock())
+        if user_id is None:
+            self.root = None
+            self.user_info_json = USER_INFO_JSON
+            self.vector_db_dir = VECTOR_DB_DIR
+            self.document_registry_path = DOCUMENT_REGISTRY_PATH
+        else:
+            self.root = tenant_root(user_id)
+            self.user_info_json = os.path.join(self.root, os.path.basename(USER_INFO_JSON))
+            self.vector_db_dir = os.path.join(self.root, VECTOR_DB_DIR)
+            self.document_registry_path = os.path.join(self.vector_db_dir, os.path.basename(DOCUMENT_REGISTRY_PATH))
+        self.vector_store = None
+        self.document_registry = None
+        self.lexical_index = None
+        self.profile_store = None
+
+def tenant_root(user_id):
+    """Storage root of user_id: TENANTS_DIR/<first two hex digits of its hash>/<user_id>."""
+    return os.path.join(TENANTS_DIR, hash_text(user_id)[:2], user_id)
+
+def get_tenant(user_id=None):
+    """
+    Return the storage context of user_id (the single-user layout if None). Contexts are kept
+    in an LRU so recently active users' stores stay open; the least recently used are dropped
+    from the cache and released once no request uses them.
+    """
+    global _default_tenant
+    if user_id is not None and not (isinstance(user_id, str) and USER_ID_PATTERN.fullmatch(user_id)):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    with _tenant_lock:
+        if user_id is None:
+            if _default_tenant is None:
+                _default_tenant = TenantContext()
+            return _default_tenant
+        tenant = _tenants.get(user_id)
+        if tenant is not None:
+            _tenants.move_to_end(user_id)
+            return tenant
+        tenant = _tenants[user_id] = TenantContext(user_id)
+        while len(_tenants) > TENANT_CACHE_SIZE:
+            # Requests still using an evicted context keep their own reference until they finish
+            evicted_id, _ = _tenants.popitem(last=False)
+            logging.info(f"Dropped cached stores of inactive user '{evicted_id}'")
+        return tenant
+
+def current_tenant():
+    """Return the storage context of the request being handled on this thread."""
+    tenant = getattr(_request_state, "tenant", None)
+    return tenant if tenant is not None else get_tenant()
+
+def get_document_registry():
+    """Return the current user's registry of ingested documents."""
+    tenant = current_tenant()
+    with _client_lock:
+        if tenant.document_registry is None:
+            tenant.document_registry = DocumentRegistry(tenant.document_registry_path)
+        return tenant.document_registry
+
+def get_lexical_index():
+    """Return the BM25 index of the current user's chunks in the active vector backend."""
+    tenant = current_tenant()
+    with _client_lock:
+        if tenant.lexical_index is None:
+            tenant.lexical_index = LexicalIndex(
+                os.path.join(tenant.vector_db_dir, f"lexical_{VECTOR_BACKEND}.sqlite3")
+            )
+        return tenant.lexical_index
+
+def rebuild_lexical_index(vector_store):
+    """Re-index every chunk in the vector store for BM25 search."""
+    ids, texts, metadatas = vector_store.all_chunks()
+    get_lexical_index().rebuild(ids, texts, metadatas)
+    logging.info(f"Rebuilt BM25 index with {len(ids)} chunks")
+
+def get_embedding_cache():
+    """Return the shared on-disk embedding cache."""
+    global _embedding_cache
+    with _client_lock:
+        if _embedding_cache is None:
+            _embedding_cache = DiskCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+        return _embedding_cache
+
+def get_embeddings():
+    """Return the shared embeddings client (behind the embedding cache), creating it on first use."""
+    global _embeddings
+    cache = get_embedding_cache()
+    with _client_lock:
+        if _embeddings is None:
+            OllamaEmbeddings = lazy_import("langchain_ollama").OllamaEmbeddings
+            _embeddings = CachedEmbeddings(
+                OllamaEmbeddings(model=EMBEDDING_MODEL), cache, EMBEDDING_MODEL,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                workers=EMBEDDING_WORKERS,
+                max_retries=EMBEDDING_MAX_RETRIES,
+                retry_backoff_seconds=EMBEDDING_RETRY_BACKOFF_SECONDS,
+            )
+        return _embeddings
+
+def get_vector_store():
+    """Open (or reuse the already opened) vector store holding every one of the current user's chunks."""
+    tenant = current_tenant()
+    embeddings = get_embeddings()
+    with _client_lock:
+        if tenant.vector_store is None:
+            lazy_import("langchain_community.vectorstores" if VECTOR_BACKEND == "chroma" else "numpy")
+            tenant.vector_store = open_document_store(VECTOR_BACKEND, tenant.vector_db_dir, embeddings)
+        return tenant.vector_store
+
+def get_llm_cache():
+    """Return the shared on-disk LLM response cache."""
+    global _llm_cache
+    with _client_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS)
+        return _llm_cache
+
+def llm_cache_key(llm, prompt):
+    """Key a prompt by its text, the model name and every sampling parameter that affects output."""
+    params = {name: llm.options.get(name) for name in LLM_SAMPLING_PARAMS}
+    params["model"] = getattr(llm, "model", None)
+    return hash_text(json.dumps(params, sort_keys=True, default=str), prompt)
+
+def reset_request_stats(llm_cache_enabled=True):
+    """Start counting LLM cache hits/misses, context tokens saved and embedding throughput for the current request."""
+    _request_state.llm_cache_enabled = llm_cache_enabled
+    _request_state.llm_cache_stats = {"hits": 0, "misses": 0, "bypassed": not llm_cache_enabled}
+    _request_state.context_stats = {"tokens_saved": 0}
+    _request_state.embedding_stats = None
+
+def llm_cache_stats():
+    """Return the LLM cache hit/miss counters for the current request."""
+    return dict(getattr(_request_state, "llm_cache_stats", {"hits": 0, "misses": 0, "bypassed": False}))
+
+def _call_llm(llm, prompt, on_delta=None):
+    if on_delta is None:
+        return llm.invoke(input=prompt).content
+    stream = llm.stream(prompt)
+    for delta in stream:
+        on_delta(delta)
+    return stream.response.content
+
+def invoke_llm(llm, prompt, on_delta=None):
+    """
+    Invoke the chat model and return its text, serving repeated prompts from the response cache.
+    With on_delta, the text is also passed on piece by piece as it is generated (a cached response
+    in one piece).
+    """
+    if not getattr(_request_state, "llm_cache_enabled", True):
+        return _call_llm(llm, prompt, on_delta)
+
+    if not hasattr(_request_state, "llm_cache_stats"):
+        reset_request_stats()
+    stats = _request_state.llm_cache_stats
+    cache = get_llm_cache()
+    key = llm_cache_key(llm, prompt)
+
+    cached = cache.get(key)
+    if cached is not None:
+        with _llm_stats_lock:
+            stats["hits"] += 1
+        logging.info("LLM response served from cache")
+        if on_delta is not None:
+            on_delta(cached)
+        return cached
+
+    with _llm_stats_lock:
+        stats["misses"] += 1
+    content = _call_llm(llm, prompt, on_delta)
+    cache.set(key, content)
+    return content
+
 def flatten_json(data, parent_key='', sep='_'):
     """Recursively flatten a nested JSON object into a flat dictionary."""
     items = []
@@ -42,11 +352,6 @@ def flatten_json(data, parent_key='', sep='_'):
     for key, value in data.items():
         new_key = f"{parent_key}{sep}{key}" if parent_key else key
         
-        # Skip flattening vector database paths
-        if isinstance(value, str) and VECTOR_DB_DIR in value:
-            items.append((new_key, value))
-            continue
-            
         if isinstance(value, dict):
             # Handle nested dictionaries
             items.extend(flatten_json(value, new_key, sep=sep).items())
@@ -62,78 +367,617 @@ def flatten_json(data, parent_key='', sep='_'):
             items.append((new_key, value))
     return dict(items)
 
-def extract_text_from_pdf_with_ocr(file_path):
-    """Extract text from PDF using OCR."""
-    logging.info(f"Processing PDF with OCR: {file_path}")
-    
+def _render_pdf_page(file_path, page_number, dpi):
+    """Render a single PDF page to an image, or return None for an empty page."""
+    lazy_import("PIL.Image")  # Import first so the pixel limit is lifted before rendering
+    convert_from_path = lazy_import("pdf2image").convert_from_path
+
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return images[0] if images else None
+
+def _ocr_with_confidence(image):
+    """
+    OCR an image, returning its text, the mean Tesseract word confidence (0-100, None if no
+    words were found) and the number of words.
+    """
+    pytesseract = lazy_import("pytesseract")
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append(word)
+
+    # Rebuild the text line by line, separating paragraphs with a blank line
+    text_lines = []
+    previous_par = None
+    for (block, par, _), words in sorted(lines.items()):
+        if previous_par is not None and previous_par != (block, par):
+            text_lines.append("")
+        text_lines.append(" ".join(words))
+        previous_par = (block, par)
+
+    mean_conf = sum(confidences) / len(confidences) if confidences else None
+    return "\n".join(text_lines), mean_conf, len(confidences)
+
+def _ocr_pdf_page(file_path, page_number, mode, dpi, adaptive_dpis, confidence_threshold):
+    """
+    Render a single PDF page and OCR it. Runs inside an OCR worker process.
+    In adaptive mode the page is read at the lowest DPI first and only re-rendered at
+    the next DPI while Tesseract's mean word confidence is below the threshold. A page with
+    (almost) no words at the lowest DPI is blank, not hard to read, so it isn't escalated.
+    Returns {"text", "dpi", "confidence"}.
+    """
+    if mode != "adaptive":
+        pytesseract = lazy_import("pytesseract")
+        image = _render_pdf_page(file_path, page_number, dpi)
+        text = pytesseract.image_to_string(image) if image is not None else ""
+        return {"text": text, "dpi": dpi, "confidence": None}
+
+    best = {"text": "", "dpi": adaptive_dpis[0], "confidence": None}
+    for candidate_dpi in adaptive_dpis:
+        image = _render_pdf_page(file_path, page_number, candidate_dpi)
+        if image is None:
+            break
+        text, confidence, word_count = _ocr_with_confidence(image)
+        del image  # Release the render before trying a higher resolution
+        if candidate_dpi == adaptive_dpis[0] and word_count < OCR_MIN_WORDS:
+            return {"text": text, "dpi": candidate_dpi,
+                    "confidence": None if confidence is None else round(confidence, 2)}
+        if confidence is not None and (best["confidence"] is None or confidence >= best["confidence"]):
+            best = {"text": text, "dpi": candidate_dpi, "confidence": round(confidence, 2)}
+        if confidence is not None and confidence >= confidence_threshold:
+            break
+    return best
+
+def get_ocr_cache():
+    """Return the shared on-disk OCR/text cache."""
+    global _ocr_cache
+    with _client_lock:
+        if _ocr_cache is None:
+            _ocr_cache = DiskCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES)
+        return _ocr_cache
+
+def get_tesseract_version():
+    """Return the installed Tesseract version (looked up once per process)."""
+    global _tesseract_version
+    if _tesseract_version is None:
+        _tesseract_version = str(lazy_import("pytesseract").get_tesseract_version())
+    return _tesseract_version
+
+def ocr_engine_config():
+    """Describe the OCR engine and DPI strategy; part of every cached page key."""
+    if OCR_MODE == "adaptive":
+        dpis = "/".join(str(dpi) for dpi in OCR_ADAPTIVE_DPIS)
+        strategy = f"adaptive-{dpis}-conf{OCR_CONFIDENCE_THRESHOLD}-min{OCR_MIN_WORDS}"
+    else:
+        strategy = f"fixed-{OCR_DPI}"
+    return f"tesseract-{get_tesseract_version()}|{strategy}"
+
+def get_ocr_pool(workers):
+    """Return the shared OCR process pool, recreating it if the worker count changed."""
+    global _ocr_pool, _ocr_pool_workers
+    with _client_lock:
+        if _ocr_pool is None or _ocr_pool_workers != workers:
+            if _ocr_pool is not None:
+                _ocr_pool.shutdown(wait=False)
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers)
+            _ocr_pool_workers = workers
+        return _ocr_pool
+
+def map_bounded(executor, fn, arg_tuples, max_in_flight):
+    """Yield fn(*args) results in input order, keeping at most max_in_flight tasks pending."""
+    pending = deque()
+    for args in arg_tuples:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, *args))
+    while pending:
+        yield pending.popleft().result()
+
+def iter_ocr_pdf_pages(file_path, pages, workers=None, max_pages_in_flight=None, file_hash=None):
+    """
+    OCR the given 1-based PDF page numbers, yielding (page, result dict) in page order
+    as soon as each page is ready. Pages already in the OCR cache are returned without
+    rendering. The rest are rendered one at a time inside a pool of worker processes,
+    with at most max_pages_in_flight pages queued or being processed, so memory stays bounded.
+    """
+    workers = workers or OCR_WORKERS
+    max_pages_in_flight = max(max_pages_in_flight or OCR_MAX_PAGES_IN_FLIGHT, 1)
+    cache = get_ocr_cache()
+    file_hash = file_hash or hash_file(file_path)
+    config = ocr_engine_config()
+    pages = list(pages)
+
+    cached_results = {}
+    for page in pages:
+        cached = cache.get(f"{file_hash}|{config}|page{page}")
+        if cached is not None:
+            cached_results[page] = json.loads(cached)
+    missing = [page for page in pages if page not in cached_results]
+    if cached_results:
+        logging.info(f"OCR cache hit for {len(cached_results)} of {len(pages)} pages")
+
+    page_args = [
+        (file_path, page, OCR_MODE, OCR_DPI, OCR_ADAPTIVE_DPIS, OCR_CONFIDENCE_THRESHOLD)
+        for page in missing
+    ]
+    if workers <= 1 or len(page_args) <= 1:
+        ocr_results = (_ocr_pdf_page(*args) for args in page_args)
+    else:
+        pool = get_ocr_pool(workers)
+        ocr_results = map_bounded(pool, _ocr_pdf_page, page_args, max_pages_in_flight)
+    ocr_results = zip(missing, ocr_results)
+
+    for page in pages:
+        if page in cached_results:
+            yield page, cached_results[page]
+            continue
+        _, result = next(ocr_results)
+        result["method"] = "ocr"
+        cache.set(f"{file_hash}|{config}|page{page}", json.dumps(result))
+        yield page, result
+
+def extract_text_layer(file_path, file_hash=None):
+    """Return the embedded text of each PDF page, with '' for image-only pages."""
+    cache = get_ocr_cache()
+    cache_key = f"{file_hash or hash_file(file_path)}|text_layer|pdfplumber"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    pdfplumber = lazy_import("pdfplumber")
+    with pdfplumber.open(file_path) as pdf:
+        texts = [page.extract_text() or "" for page in pdf.pages]
+    cache.set(cache_key, json.dumps(texts))
+    return texts
+
+def pdf_page_document(file_path, page, result):
+    """Build the Document for one PDF page, keeping the page marker used in prompts."""
+    Document = lazy_import("langchain_core.documents").Document
+    metadata = {"source": file_path, "page": page, "extraction": result["method"]}
+    if result["method"] == "ocr":
+        metadata.update({"ocr_mode": OCR_MODE, "ocr_dpi": result["dpi"]})
+    return Document(page_content=f"\n--- Page {page} ---\n{result['text']}\n", metadata=metadata)
+
+def iter_pdf_pages(file_path):
+    """
+    Yield one Document per PDF page, in order, as soon as that page is ready.
+    Pages with an embedded text layer are read directly; image-only pages are OCR'd.
+    """
+    file_hash = hash_file(file_path)
     try:
-        # Convert PDF pages to images
-        images = convert_from_path(file_path, dpi=900)
-        logging.info(f"Converted PDF to {len(images)} images")
-        
-        # Process each page with OCR
-        text_content = []
-        for i, image in enumerate(images):
-            logging.info(f"Processing page {i+1} with OCR")
-            text = pytesseract.image_to_string(image)
-            text_content.append(text)
-            
-        # Combine all pages with page numbers for context
-        full_text = ""
-        for i, text in enumerate(text_content):
-            full_text += f"\n--- Page {i+1} ---\n{text}\n"
-            
-        return [Document(page_content=full_text, metadata={"source": file_path})]
-        
+        layer_texts = extract_text_layer(file_path, file_hash)
     except Exception as e:
-        logging.error(f"Error processing PDF with OCR: {e}")
-        return None
+        logging.warning(f"Could not read text layer from {file_path} ({e}), using OCR for all pages")
+        page_count = lazy_import("pdf2image").pdfinfo_from_path(file_path)["Pages"]
+        layer_texts = [""] * page_count
+
+    ocr_pages = [
+        i + 1 for i, text in enumerate(layer_texts)
+        if len(text.strip()) < MIN_TEXT_LAYER_CHARS
+    ]
+    logging.info(
+        f"PDF has {len(layer_texts)} pages: {len(layer_texts) - len(ocr_pages)} with a text layer, "
+        f"{len(ocr_pages)} need OCR"
+    )
+
+    next_page = 1
+    for ocr_page, result in iter_ocr_pdf_pages(file_path, ocr_pages, file_hash=file_hash):
+        # Emit any text-layer pages that come before this OCR'd page
+        for page in range(next_page, ocr_page):
+            yield pdf_page_document(file_path, page, {"text": layer_texts[page - 1], "method": "text_layer"})
+        yield pdf_page_document(file_path, ocr_page, result)
+        next_page = ocr_page + 1
+    for page in range(next_page, len(layer_texts) + 1):
+        yield pdf_page_document(file_path, page, {"text": layer_texts[page - 1], "method": "text_layer"})
+
+def ocr_image_file(file_path):
+    """OCR an image file, reusing cached text for identical file contents."""
+    cache = get_ocr_cache()
+    cache_key = f"{hash_file(file_path)}|tesseract-{get_tesseract_version()}|image"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"OCR cache hit for {file_path}")
+        return cached
+
+    Image = lazy_import("PIL.Image")
+    pytesseract = lazy_import("pytesseract")
+    text = pytesseract.image_to_string(Image.open(file_path))
+    cache.set(cache_key, text)
+    return text
+
+def iter_ingest_file(file_path):
+    """
+    Yield Documents for a file (PDF, Word, image, or CSV) as they become available.
+    PDFs yield one Document per page with page metadata; errors propagate to the caller.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == ".pdf":
+        # Read embedded text where possible, OCR only image-only pages
+        yield from iter_pdf_pages(file_path)
+    elif ext in [".doc", ".docx"]:
+        UnstructuredWordDocumentLoader = lazy_import("langchain_community.document_loaders").UnstructuredWordDocumentLoader
+        loader = UnstructuredWordDocumentLoader(file_path=file_path)
+        yield from loader.load()
+    elif ext in [".png", ".jpg", ".jpeg"]:
+        Document = lazy_import("langchain_core.documents").Document
+        yield Document(page_content=ocr_image_file(file_path), metadata={"source": file_path})
+    elif ext == ".csv":
+        CSVLoader = lazy_import("langchain.document_loaders.csv_loader").CSVLoader
+        loader = CSVLoader(file_path=file_path)
+        yield from loader.load()
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
 
 def ingest_file(file_path):
-    """Load a file (PDF, Word, image, or CSV) with OCR for PDFs."""
+    """Load a file (PDF, Word, image, or CSV), using OCR for scanned PDF pages and images."""
     if not os.path.exists(file_path):
         logging.error(f"File not found: {file_path}")
         return None
         
-    ext = os.path.splitext(file_path)[1].lower()
-    
     try:
-        if ext == ".pdf":
-            # Use OCR for PDF processing
-            data = extract_text_from_pdf_with_ocr(file_path)
-        elif ext in [".doc", ".docx"]:
-            loader = UnstructuredWordDocumentLoader(file_path=file_path)
-            data = loader.load()
-        elif ext in [".png", ".jpg", ".jpeg"]:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image)
-            data = [Document(page_content=text, metadata={"source": file_path})]
-        elif ext == ".csv":
-            loader = CSVLoader(file_path=file_path)
-            data = loader.load()
-        else:
-            logging.error(f"Unsupported file format: {ext}")
-            return None
-            
-        logging.info(f"File {file_path} loaded successfully with {len(data) if data else 0} documents.")
+        data = list(iter_ingest_file(file_path))
+        logging.info(f"File {file_path} loaded successfully with {len(data)} documents.")
         return data
     except Exception as e:
         logging.error(f"Error loading file {file_path}: {e}")
         return None
 
-def split_documents(documents):
-    """Split documents into smaller chunks with optimized parameters."""
-    if not documents:
-        logging.warning("No documents to split")
-        return []
-        
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=1000)
-    chunks = text_splitter.split_documents(documents)
-    logging.info(f"Documents split into {len(chunks)} chunks.")
-    return chunks
+def iter_split_documents(documents):
+    """
+    Split each Document as it arrives, yielding that Document's chunks as a list. Each chunk's
+    metadata records element_index, the position of its Document in the file (a PDF page, CSV
+    row or Word element), since its start_index is only an offset within that Document.
+    """
+    RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters").RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    for element_index, document in enumerate(documents):
+        document.metadata = dict(document.metadata or {}, element_index=element_index)
+        yield text_splitter.split_documents([document])
+
+def ingest_and_index(file_path, doc_id, extractor=None):
+    """
+    Stream a document through loading, splitting and embedding one page at a time,
+    so early pages are handed to extractor (if given) while later pages are still being
+    OCR'd. Chunks are indexed once enough pages have accumulated to fill every concurrent
+    embeddings batch, and at the end of the document. Any chunks previously stored for
+    doc_id are replaced once the new ones are in place.
+    Returns (chunks, vector_db); chunks is None if the file couldn't be loaded and
+    vector_db is None if indexing failed or produced nothing.
+    """
+    if not os.path.exists(file_path):
+        logging.error(f"File not found: {file_path}")
+        return None, None
+
+    chunks = []
+    pending = []
+    added_ids = []
+    indexing_failed = False
+    index_seconds = 0.0
+    index_threshold = EMBEDDING_BATCH_SIZE * EMBEDDING_WORKERS
+    try:
+        previous_ids = get_vector_store().chunk_ids(doc_id)
+        embedding_stats_before = get_embeddings().stats()
+    except Exception as e:
+        logging.error(f"Error opening vector store: {e}")
+        previous_ids, indexing_failed = [], True
+    start = time.perf_counter()
+
+    def index_pending():
+        nonlocal indexing_failed, index_seconds
+        if not indexing_failed and pending:
+            index_start = time.perf_counter()
+            ids = create_vector_db(pending, doc_id)
+            index_seconds += time.perf_counter() - index_start
+            indexing_failed = ids is None
+            added_ids.extend(ids or [])
+        pending.clear()
+
+    try:
+        for page_chunks in iter_split_documents(iter_ingest_file(file_path)):
+            if not page_chunks:
+                continue
+            if not chunks:
+                logging.info(f"First chunks of {file_path} ready after {time.perf_counter() - start:.2f}s")
+            chunks.extend(page_chunks)
+            if extractor is not None:
+                extractor.add_chunks(page_chunks)
+            pending.extend(page_chunks)
+            if len(pending) >= index_threshold:
+                index_pending()
+        index_pending()
+    except Exception as e:
+        logging.error(f"Error loading file {file_path}: {e}")
+        # Drop any partially added chunks and keep the previous version
+        discard_chunks(added_ids)
+        persist_vector_store()
+        return None, None
+
+    if indexing_failed or not added_ids:
+        # Keep the previous version whole rather than mixing it with some of the new pages
+        discard_chunks(added_ids)
+        vector_db = None
+    else:
+        vector_db = get_vector_store()
+        if previous_ids:
+            discard_chunks(previous_ids)
+            logging.info(f"Replaced {len(previous_ids)} previous chunks for '{doc_id}'")
+        record_embedding_stats(len(chunks), embedding_stats_before, get_embeddings().stats(), index_seconds)
+    # Written once per document rather than per batch
+    persist_vector_store()
+
+    logging.info(f"File {file_path} streamed into {len(chunks)} chunks in {time.perf_counter() - start:.2f}s")
+    return chunks, vector_db
+
+def index_document(file_path, extractor=None, content_hash=None):
+    """
+    Ingest and index a document under a doc_id derived from its file name, recording it in the
+    document registry. Returns (doc_id, chunks, vector_db) as for ingest_and_index.
+    A failed re-ingest leaves an indexed document's row as it was, since its previous
+    chunks stay in the store.
+    """
+    doc_id = sanitize_collection_name(os.path.splitext(os.path.basename(file_path))[0])
+    registry = get_document_registry()
+    if content_hash is None and os.path.exists(file_path):
+        content_hash = hash_file(file_path)
+    previous = registry.get(doc_id)
+    reindexing = previous is not None and previous["status"] == "indexed"
+    if not reindexing:
+        registry.upsert(doc_id, content_hash=content_hash, source=os.path.basename(file_path), status="indexing")
+
+    chunks, vector_db = ingest_and_index(file_path, doc_id, extractor)
+    if vector_db is None and reindexing:
+        logging.warning(f"Re-indexing '{doc_id}' failed; keeping the previously indexed version")
+        return doc_id, chunks, None
+    if chunks is None:
+        registry.upsert(doc_id, status="failed", chunk_count=0, page_count=0)
+        return doc_id, None, None
+
+    registry.upsert(
+        doc_id,
+        content_hash=content_hash,
+        source=os.path.basename(file_path),
+        collection=os.path.basename(vector_db.persist_dir) if vector_db else None,
+        chunk_count=len(chunks) if vector_db else 0,
+        page_count=len({chunk.metadata.get("page") for chunk in chunks}),
+        status="indexed" if vector_db else "index_failed",
+    )
+    return doc_id, chunks, vector_db
+
+def estimate_tokens(text):
+    """Rough token count for budgeting prompts (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+def _suffix_prefix_overlap(left, right):
+    """Length of the longest suffix of left that is also a prefix of right (KMP, linear time)."""
+    if not left or not right:
+        return 0
+    combined = right + "\x00" + left[-len(right):]
+    failure = [0] * len(combined)
+    for i in range(1, len(combined)):
+        k = failure[i - 1]
+        while k and combined[i] != combined[k]:
+            k = failure[k - 1]
+        if combined[i] == combined[k]:
+            k += 1
+        failure[i] = k
+    return failure[-1]
+
+def chunk_parent(chunk):
+    """
+    Key of the loaded Document a chunk was split from: (source, page, element_index).
+    Only chunks with the same parent can overlap; CSV rows, for example, share a source and
+    have no page, and every row's chunks start at offset 0.
+    """
+    meta = chunk.metadata or {}
+    return meta.get("source"), meta.get("page"), meta.get("element_index")
+
+def chunk_overlap_length(previous, chunk):
+    """Number of leading characters of chunk already covered by the previous chunk."""
+    prev_meta, meta = previous.metadata or {}, chunk.metadata or {}
+    if chunk_parent(previous) != chunk_parent(chunk):
+        return 0
+    if "start_index" in prev_meta and "start_index" in meta:
+        prev_end = prev_meta["start_index"] + len(previous.page_content)
+        return min(max(prev_end - meta["start_index"], 0), len(chunk.page_content))
+    # Without offsets, never assume more overlap than the splitter produces, and
+    # keep short matches (a repeated word or line ending) that are likely coincidental
+    overlap = _suffix_prefix_overlap(previous.page_content, chunk.page_content)
+    if overlap < MIN_TEXT_OVERLAP:
+        return 0
+    return min(overlap, CHUNK_OVERLAP)
+
+def chunk_separator(previous, chunk, overlap):
+    """Text to put between two consecutive chunks of the same parent before appending the second."""
+    if overlap:
+        return ""
+    prev_meta, meta = previous.metadata or {}, chunk.metadata or {}
+    if "start_index" in prev_meta and "start_index" in meta:
+        prev_end = prev_meta["start_index"] + len(previous.page_content)
+        return "" if meta["start_index"] <= prev_end else "\n...\n"
+    return "\n"
+
+def assemble_context(chunks):
+    """
+    Rebuild the deduplicated source text covered by chunks for use in a prompt.
+    Chunks split from the same Document (see chunk_parent) are ordered by their start_index and
+    only the part beyond the previous chunk's end is kept; without offsets, the longest
+    suffix/prefix overlap is removed instead. Chunks that don't overlap are kept apart by a
+    newline, or by an ellipsis line when their offsets show text was skipped between them.
+    Returns (text, tokens_saved).
+    """
+    groups = {}
+    for chunk in chunks:
+        groups.setdefault(chunk_parent(chunk), []).append(chunk)
+
+    segments = []
+    for group in groups.values():
+        if all("start_index" in (chunk.metadata or {}) for chunk in group):
+            group = sorted(group, key=lambda chunk: chunk.metadata["start_index"])
+        text = group[0].page_content
+        for previous, chunk in zip(group, group[1:]):
+            overlap = chunk_overlap_length(previous, chunk)
+            text += chunk_separator(previous, chunk, overlap) + chunk.page_content[overlap:]
+        segments.append(text)
+
+    assembled = " ".join(segments)
+    naive_tokens = estimate_tokens(" ".join(chunk.page_content for chunk in chunks))
+    tokens_saved = max(naive_tokens - estimate_tokens(assembled), 0)
+    if tokens_saved:
+        logging.info(f"Context assembly removed ~{tokens_saved} duplicated tokens from {len(chunks)} chunks")
+    return assembled, tokens_saved
+
+def record_context_savings(tokens_saved):
+    """Add to the current request's count of prompt tokens saved by context assembly."""
+    if not hasattr(_request_state, "context_stats"):
+        reset_request_stats()
+    with _llm_stats_lock:
+        _request_state.context_stats["tokens_saved"] += tokens_saved
+
+def record_embedding_stats(chunks, before, after, seconds):
+    """
+    Store the current request's embedding throughput, from embeddings client stats taken
+    before and after indexing and the wall time spent indexing.
+    """
+    embedded = after["misses"] - before["misses"]
+    embed_seconds = after["embed_seconds"] - before["embed_seconds"]
+    _request_state.embedding_stats = {
+        "chunks": chunks,
+        "embedded": embedded,
+        "cache_hits": after["hits"] - before["hits"],
+        "retries": after["retries"] - before["retries"],
+        "batch_size": EMBEDDING_BATCH_SIZE,
+        "workers": EMBEDDING_WORKERS,
+        "embed_seconds": round(embed_seconds, 3),
+        "index_seconds": round(seconds, 3),
+        # Chunks actually sent to the embeddings server per second spent waiting on it
+        "embedded_chunks_per_second": round(embedded / embed_seconds, 2) if embed_seconds else None,
+        # All chunks written to the vector store (cache hits included) per second of indexing
+        "chunks_per_second": round(chunks / seconds, 2) if seconds else None,
+    }
+
+def merge_partial_extractions(partials):
+    """
+    Merge per-group extraction results into one flat dict.
+    Non-empty values beat empty ones; conflicting values are resolved by how many groups
+    agree, then by the most complete (longest) value, then by the latest group.
+    """
+    candidates = {}
+    for order, partial in enumerate(partials):
+        for key, value in flatten_json(partial).items():
+            candidates.setdefault(key, []).append((order, value))
+
+    merged = {}
+    for key, values in candidates.items():
+        non_empty = [(order, value) for order, value in values if value not in ("", None)]
+        if not non_empty:
+            merged[key] = values[-1][1]
+            continue
+        counts = {}
+        for _, value in non_empty:
+            counts[str(value)] = counts.get(str(value), 0) + 1
+        _, best = max(non_empty, key=lambda item: (counts[str(item[1])], len(str(item[1])), item[0]))
+        if len(counts) > 1:
+            logging.info(f"Resolved conflicting values for '{key}': {sorted(counts)} -> {best!r}")
+        merged[key] = best
+    return merged
+
+class ChunkExtractor:
+    """
+    Extracts key-value info from chunks as they stream in.
+    In map_reduce mode chunks are packed into groups that fit the token budget, and each
+    full group is sent to the LLM right away on a bounded thread pool; result() extracts the
+    last group, waits for the rest and merges the partial JSON objects locally.
+    In single mode chunks are collected and extracted with one prompt in result().
+    Use it as a context manager so pending extractions are cancelled if ingest fails.
+    """
+
+    def __init__(self, llm, mode=None, token_budget=None, concurrency=None):
+        self.llm = llm
+        self.mode = mode or EXTRACTION_MODE
+        self.token_budget = token_budget or EXTRACTION_TOKEN_BUDGET
+        self.chunks = []
+        self._group = []
+        self._group_tokens = 0
+        self._futures = []
+        self._executor = None
+        if self.mode == "map_reduce":
+            self._executor = ThreadPoolExecutor(max_workers=max(concurrency or EXTRACTION_CONCURRENCY, 1))
+        # Worker threads share this request's cache settings and counters
+        if not hasattr(_request_state, "llm_cache_stats"):
+            reset_request_stats()
+        self._request_state = dict(vars(_request_state))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        """Stop the thread pool, cancelling any extractions that haven't started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract_group(self, group):
+        vars(_request_state).update(self._request_state)
+        return extract_key_value_info(group, None, self.llm, mode="single")
+
+    def _flush(self):
+        if self._group:
+            self._futures.append(self._executor.submit(self._extract_group, self._group))
+            self._group, self._group_tokens = [], 0
+
+    def add_chunks(self, chunks):
+        self.chunks.extend(chunks)
+        if self.mode != "map_reduce":
+            return
+        for chunk in chunks:
+            # Budget only the text this chunk adds beyond its overlap with the previous one
+            overlap = chunk_overlap_length(self._group[-1], chunk) if self._group else 0
+            tokens = estimate_tokens(chunk.page_content[overlap:])
+            if self._group and self._group_tokens + tokens > self.token_budget:
+                self._flush()
+                tokens = estimate_tokens(chunk.page_content)
+            self._group.append(chunk)
+            self._group_tokens += tokens
+
+    def result(self):
+        if self.mode != "map_reduce":
+            return extract_key_value_info(self.chunks, None, self.llm, mode="single")
+
+        self._flush()
+        try:
+            partials = [future.result() for future in self._futures]
+        finally:
+            self.close()
+        if not partials:
+            logging.warning("No chunks provided for extraction")
+            return {}
+        if len(partials) == 1:
+            return partials[0]
+        merged = merge_partial_extractions(partials)
+        logging.info(f"Merged {len(partials)} partial extractions into {len(merged)} fields")
+        return merged
+
+def extract_key_value_info(chunks, text, llm, mode=None):
+    """
+    Extract key-value pairs from document chunks or text using enhanced prompts.
+    With mode 'map_reduce' (the default for chunks), chunks are extracted in token-budgeted
+    groups concurrently and the partial results merged; 'single' uses one prompt.
+    """
+    if text is None and (mode or EXTRACTION_MODE) == "map_reduce":
+        extractor = ChunkExtractor(llm, mode="map_reduce")
+        extractor.add_chunks(chunks or [])
+        return extractor.result()
 
-def extract_key_value_info(chunks, text, llm):
-    """Extract key-value pairs from document chunks or text using enhanced prompts."""
     try:
         if text is not None:
             full_text = text
@@ -162,7 +1006,9 @@ def extract_key_value_info(chunks, text, llm):
                 logging.warning("No chunks provided for extraction")
                 return {}
                 
-            full_text = " ".join([chunk.page_content for chunk in chunks])
+            # Rebuild the source text once instead of repeating every chunk overlap
+            full_text, tokens_saved = assemble_context(chunks)
+            record_context_savings(tokens_saved)
             prompt = (
                 "You are an expert data extraction specialist working with vector database content. Analyze the following data carefully.\n\n"
                 "TASK: Extract ALL relevant information into a FLAT (non-nested) JSON object with simple key-value pairs.\n\n"
@@ -187,8 +1033,7 @@ def extract_key_value_info(chunks, text, llm):
                 "OUTPUT (FLAT JSON ONLY):"
             )
             
-        result = llm.invoke(input=prompt)
-        raw_output = result.content.strip()
+        raw_output = invoke_llm(llm, prompt).strip()
         
         # Robust JSON extraction
         json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
@@ -233,64 +1078,96 @@ def sanitize_collection_name(name: str) -> str:
         name = name[:63]
     return name
 
-def create_vector_db(chunks, collection_name):
-    """Create and persist a vector database from document chunks."""
+def create_vector_db(chunks, doc_id):
+    """
+    Add a document's chunks to the shared vector store and BM25 index, tagged with doc_id.
+    Returns the new chunk ids, or None if indexing failed (nothing from this call is kept).
+    """
     if not chunks:
         logging.error("No chunks provided to create vector database")
         return None
     
-    # Ensure the vector DB directory exists
-    os.makedirs(VECTOR_DB_DIR, exist_ok=True)    
-    persist_dir = os.path.join(VECTOR_DB_DIR, collection_name)
-    os.makedirs(persist_dir, exist_ok=True)
-    
+    ids = []
     try:
-        vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=OllamaEmbeddings(model=EMBEDDING_MODEL),
-            collection_name=collection_name,
-            persist_directory=persist_dir,
+        # Reuse the opened store so serve mode doesn't reopen Chroma per request
+        vector_store = get_vector_store()
+        ids = vector_store.add_chunks(doc_id, chunks)
+        # Keep the BM25 index in step so exact identifiers are searchable too
+        get_lexical_index().add_chunks(
+            ids, [chunk.page_content for chunk in chunks], [chunk_metadata(doc_id, chunk) for chunk in chunks]
         )
-        vector_db.persist()
-        logging.info(f"Vector database created and persisted to {persist_dir}")
-        return vector_db
+        logging.info(f"Added {len(chunks)} chunks for '{doc_id}' to {vector_store.persist_dir}")
+        return ids
     except Exception as e:
         logging.error(f"Error creating vector database: {e}")
+        discard_chunks(ids)
         return None
 
-def update_user_info_json(new_info, json_file=USER_INFO_JSON):
-    """Update the user_info JSON file with new key-value pairs."""
-    # Create directory if it doesn't exist
-    os.makedirs(os.path.dirname(json_file), exist_ok=True)
-    
-    if os.path.exists(json_file):
-        try:
-            with open(json_file, "r") as f:
-                user_info = json.load(f)
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding JSON from {json_file}: {e}. Initializing empty user_info.")
-            user_info = {}
-    else:
-        user_info = {}
-    
-    user_info.update(new_info)
-    
+def discard_chunks(ids):
+    """Remove chunks from both the vector store and the BM25 index."""
+    if not ids:
+        return
     try:
-        with open(json_file, "w") as f:
-            json.dump(user_info, f, indent=4)
-        logging.info(f"User info JSON updated with {len(new_info)} new key-value pairs.")
+        get_vector_store().delete_chunks(ids)
+        get_lexical_index().delete_chunks(ids)
     except Exception as e:
-        logging.error(f"Error writing to {json_file}: {e}")
+        logging.error(f"Error removing chunks: {e}")
 
-def load_user_info(json_file=USER_INFO_JSON):
-    """Load and return user information from the JSON file."""
-    if os.path.exists(json_file):
-        try:
-            with open(json_file, "r") as f:
-                user_info = json.load(f)
-            return user_info
-        except Exception as e:
-            logging.error(f"Error reading {json_file}: {e}")
+def persist_vector_store():
+    """Write the vector store's pending changes to disk (the NumPy backend buffers them)."""
+    try:
+        get_vector_store().persist()
+    except Exception as e:
+        logging.error(f"Error saving vector store: {e}")
+
+def is_vector_db_path(value):
+    """True for the vector DB paths older versions stored in user_info.json next to profile fields."""
+    return isinstance(value, str) and (
+        value == VECTOR_DB_DIR or value.startswith((VECTOR_DB_DIR + "/", VECTOR_DB_DIR + "\\"))
+    )
+
+def strip_vector_db_paths(user_info):
+    """Split user_info into (profile fields, {doc_id: legacy vector DB path})."""
+    profile, legacy = {}, {}
+    for key, value in user_info.items():
+        (legacy if is_vector_db_path(value) else profile)[key] = value
+    return profile, legacy
+
+def get_profile_store():
+    """
+    Return the profile store backing the current user's user_info.json (kept next to it as a
+    .sqlite3 file), importing the existing JSON the first time it is opened.
+    """
+    tenant = current_tenant()
+    with _client_lock:
+        if tenant.profile_store is None:
+            json_file = tenant.user_info_json
+            store = ProfileStore(os.path.splitext(json_file)[0] + ".sqlite3", export_path=json_file)
+            # Documents are tracked in the document registry; drop paths left by older versions
+            store.import_json(json_file, transform=lambda info: strip_vector_db_paths(info)[0])
+            tenant.profile_store = store
+        return tenant.profile_store
+
+def update_user_info_json(new_info, source=None):
+    """
+    Upsert key-value pairs into the current user's profile store, recording source (e.g. "document:w2"),
+    and refresh the user_info JSON export. Returns {"version", "changed": {key: value}}.
+    """
+    try:
+        changes = get_profile_store().upsert(new_info, source=source)
+        logging.info(f"User info updated: {len(changes['changed'])} of {len(new_info)} fields changed "
+                     f"(profile version {changes['version']})")
+        return changes
+    except Exception as e:
+        logging.error(f"Error updating user info in {current_tenant().user_info_json}: {e}")
+        return {"version": None, "changed": {}}
+
+def load_user_info():
+    """Load and return the current user's information from the profile store."""
+    try:
+        return get_profile_store().get_all()
+    except Exception as e:
+        logging.error(f"Error reading user info for {current_tenant().user_info_json}: {e}")
     return {}
 
 def format_chat_history(chat_history_path):
@@ -388,25 +1265,129 @@ def create_chain(new_form, llm, user_info="", uploaded=None):
                 question=question
             )
             
-            response = llm.invoke(input=prompt_text)
-            return response.content.strip()
+            return invoke_llm(llm, prompt_text).strip()
         except Exception as e:
             logging.error(f"Error in chain invoke: {e}")
             return f"I encountered an error while processing your question: {e}"
     
     return chain_invoke
 
+def pre_merge_fields(current_info: dict, new_info: dict):
+    """
+    Map new_info's fields onto current_info's without the LLM, trying an exact key match,
+    then a normalized match, then the shared field schema's canonical fields (ignoring generic
+    aliases such as "status", which are too vague to merge on). A specific field ("cellPhone")
+    also maps onto its group's general field ("phone"), but never onto a sibling ("homePhone"),
+    so one number can't overwrite the other.
+    Returns (mapping, ambiguous): mapping gives new field -> matching current field (None for
+    new fields); ambiguous lists only what the schema can't resolve: fields that match several
+    current fields or only share a group with some, generic aliases that appear in current
+    field names, and fields unknown to the schema that share a word with a current field also
+    unknown to it (kind words such as "name" or "date" aside, which most fields share).
+    """
+    by_normalized, by_canonical, by_group, by_general = {}, {}, {}, {}
+    for key in current_info:
+        by_normalized.setdefault(normalize_key(key), []).append(key)
+        canonical = canonical_field(key, generic=False)
+        if canonical:
+            group = field_group(key, generic=False)
+            by_canonical.setdefault(canonical, []).append(key)
+            by_group.setdefault(group, []).append(key)
+            if canonical == group:
+                by_general.setdefault(group, []).append(key)
+    current_tokens = [field_tokens(key) for key in current_info]
+    unknown_tokens = [
+        field_tokens(key) - FIELD_KIND_WORDS for key in current_info if canonical_field(key, generic=False) is None
+    ]
+
+    mapping, ambiguous = {}, []
+    for new_field in new_info:
+        if new_field in current_info:
+            mapping[new_field] = new_field
+            continue
+        canonical, group = canonical_field(new_field, generic=False), field_group(new_field, generic=False)
+        candidates = by_normalized.get(normalize_key(new_field))
+        if not candidates:
+            candidates = by_canonical.get(canonical)
+        if not candidates and canonical != group:
+            candidates = by_general.get(group)
+        if candidates and len(candidates) == 1:
+            mapping[new_field] = candidates[0]
+        elif candidates or by_group.get(group):
+            ambiguous.append(new_field)
+        elif canonical is None and canonical_field(new_field) is not None:
+            # A generic alias ("status", "id") may be any of the current fields named with it
+            if any(field_tokens(new_field) & tokens for tokens in current_tokens):
+                ambiguous.append(new_field)
+            else:
+                mapping[new_field] = None
+        elif canonical is None and any((field_tokens(new_field) - FIELD_KIND_WORDS) & tokens
+                                       for tokens in unknown_tokens):
+            ambiguous.append(new_field)
+        else:
+            mapping[new_field] = None
+    return mapping, ambiguous
+
+def apply_field_mapping(current_info: dict, new_info: dict, mapping: dict) -> dict:
+    """Return the profile updates for new_info: its values keyed by the mapped current field names."""
+    updates = {}
+    for new_field, current_field in mapping.items():
+        if new_field not in new_info:
+            logging.warning(f"Mapping includes '{new_field}', not in new_info. Skipping.")
+            continue
+            
+        if current_field is not None:
+            if current_field in current_info:
+                updates[current_field] = new_info[new_field]
+                logging.info(f"Updated field '{current_field}' with value from '{new_field}'")
+            else:
+                updates[new_field] = new_info[new_field]
+                logging.info(f"Added new field '{new_field}' (mapped field '{current_field}' doesn't exist)")
+        else:
+            updates[new_field] = new_info[new_field]
+            logging.info(f"Added new field '{new_field}'")
+    return updates
+
 def merge_user_info(current_info: dict, new_info: dict, llm) -> dict:
-    """Merge new_info into current_info using LLM-generated mapping."""
+    """
+    Merge new_info into current_info. Fields are matched locally first (exact, normalized and
+    synonym matches); only the ambiguous leftovers are sent to the LLM for a mapping.
+    Returns only the fields to write, so upserting them can't revert fields that changed in
+    the store after current_info was read.
+    """
     # If either dictionary is empty, handle the simple cases
     if not current_info:
         return new_info.copy()
     if not new_info:
-        return current_info.copy()
-    
+        return {}
+
+    start = time.perf_counter()
+    local_mapping, ambiguous = pre_merge_fields(current_info, new_info)
+    if not ambiguous:
+        logging.info(f"Merged {len(new_info)} fields locally in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return apply_field_mapping(current_info, new_info, local_mapping)
+    logging.info(f"Resolved {len(local_mapping)} fields locally; asking the LLM about {len(ambiguous)}")
+
+    # Anything the LLM doesn't resolve is kept as a new field
+    fallback_mapping = {**local_mapping, **{field: None for field in ambiguous}}
+    ambiguous_info = {field: new_info[field] for field in ambiguous}
+    # Only current fields that could plausibly match an ambiguous field are shown
+    ambiguous_tokens = set().union(*(field_tokens(field) for field in ambiguous))
+    ambiguous_groups = {field_group(field) for field in ambiguous} - {None}
+    ambiguous_normalized = {normalize_key(field) for field in ambiguous}
+    candidate_info = {
+        key: value for key, value in current_info.items()
+        if field_tokens(key) & ambiguous_tokens
+        or field_group(key) in ambiguous_groups
+        or normalize_key(key) in ambiguous_normalized
+    }
+    # Synonyms from the shared field schema, limited to the groups in play
+    synonym_lines = describe_field_groups([*ambiguous, *candidate_info]) + ["name = firstName+lastName"]
+    known_synonyms = "\n".join(f"   - {line}" for line in synonym_lines)
+
     # Format the dictionaries for better LLM comprehension
-    current_json = json.dumps(current_info, indent=2)
-    new_json = json.dumps(new_info, indent=2)
+    current_json = json.dumps(candidate_info, indent=2)
+    new_json = json.dumps(ambiguous_info, indent=2)
     
     # Create a prompt that asks the LLM to analyze both sets of fields at once
     prompt = f"""
@@ -424,13 +1405,7 @@ FIELD MATCHING RULES:
 1. Match fields that represent the same information, even if the field names differ
 2. Consider semantic meaning, not just exact field name matches
 3. Use the following known field synonyms:
-   - name = fullName, userName, firstName+lastName
-   - phone = mobile, phoneNumber, cellPhone, telephone
-   - address = homeAddress, streetAddress, residentialAddress
-   - email = emailAddress, userEmail
-   - ssn = socialSecurityNumber, taxpayerID
-   - dob = dateOfBirth, birthDate
-   - income = salary, wages, earnings, compensation
+{known_synonyms}
 
 OUTPUT INSTRUCTIONS:
 1. For each field in the NEW information, identify if it:
@@ -462,14 +1437,13 @@ YOUR MAPPING OUTPUT:
     
     try:
         # Get the LLM's analysis
-        response = llm.invoke(input=prompt)
-        result_text = response.content.strip()
+        result_text = invoke_llm(llm, prompt).strip()
         
         # Extract the JSON object (handle potential formatting issues)
         json_match = re.search(r'\{[\s\S]*\}', result_text)
         if not json_match:
             logging.warning("Could not extract JSON from LLM response, falling back to simple merge")
-            return {**current_info, **new_info}
+            return apply_field_mapping(current_info, new_info, fallback_mapping)
             
         mapping_json = json_match.group(0)
         
@@ -485,78 +1459,56 @@ YOUR MAPPING OUTPUT:
                 mapping = json.loads(mapping_json)
             except Exception as e2:
                 logging.error(f"Failed to fix mapping JSON: {e2}, falling back to simple merge")
-                return {**current_info, **new_info}
+                return apply_field_mapping(current_info, new_info, fallback_mapping)
         
         if "mapping" not in mapping:
             logging.warning("Invalid mapping format (no 'mapping' key), falling back to simple merge")
-            return {**current_info, **new_info}
+            return apply_field_mapping(current_info, new_info, fallback_mapping)
             
-        # Initialize the merged result with the current info
-        merged = current_info.copy()
-        
-        # Apply the mapping
-        for new_field, current_field in mapping["mapping"].items():
-            if new_field not in new_info:
-                logging.warning(f"Mapping includes '{new_field}', not in new_info. Skipping.")
-                continue
-                
-            if current_field is not None:
-                if current_field in merged:
-                    merged[current_field] = new_info[new_field]
-                    logging.info(f"Updated field '{current_field}' with value from '{new_field}'")
-                else:
-                    merged[new_field] = new_info[new_field]
-                    logging.info(f"Added new field '{new_field}' (mapped field '{current_field}' doesn't exist)")
-            else:
-                merged[new_field] = new_info[new_field]
-                logging.info(f"Added new field '{new_field}'")
-                
-        return merged
+        # The LLM only decides the ambiguous fields; local matches stand
+        llm_mapping = {
+            field: target for field, target in mapping["mapping"].items()
+            if field in ambiguous_info and (target is None or target in current_info)
+        }
+        logging.info(f"Merged {len(new_info)} fields in {time.perf_counter() - start:.2f}s")
+        return apply_field_mapping(current_info, new_info, {**fallback_mapping, **llm_mapping})
         
     except Exception as e:
         logging.error(f"Error in field mapping: {e}")
         # Fallback to simple merge in case of errors
-        return {**current_info, **new_info}
+        return apply_field_mapping(current_info, new_info, fallback_mapping)
 
 def update_user_info_from_doc(file_path, llm, current_info: dict):
     """
     Update user_info by processing a new document.
-    Also creates and persists a vector database for the update document.
+    Also indexes the document into the shared vector store.
+    Returns {"version", "changed"} with only the fields whose values changed.
     """
-    data = ingest_file(file_path)
-    if data is None:
-        logging.error(f"Failed to ingest document from {file_path}")
-        return current_info
-        
-    chunks = split_documents(data)
-    new_info = extract_key_value_info(chunks, None, llm)
+    # Pages are split and indexed into the shared vector store as they are read
+    with ChunkExtractor(llm) as extractor:
+        doc_id, chunks, vector_db = index_document(file_path, extractor)
+        if chunks is None:
+            logging.error(f"Failed to ingest document from {file_path}")
+            return {"version": get_profile_store().version(), "changed": {}}
+        new_info = extractor.result()
     logging.info(f"New info extracted from document: {new_info}")
     
     # Flatten the new info before merging
     flat_new_info = flatten_json(new_info)
     logging.info(f"Flattened new info: {flat_new_info}")
     
-    # Use the efficient merging function
-    merged = merge_user_info(current_info, flat_new_info, llm)
-    update_user_info_json(merged)
-    
-    # Create and persist a vector DB for the document
-    filename = os.path.basename(file_path)
-    collection_name = sanitize_collection_name(os.path.splitext(filename)[0])
-    vector_db = create_vector_db(chunks, collection_name)
-    if vector_db:
-        vector_db_path = os.path.join(VECTOR_DB_DIR, collection_name)
-        update_user_info_json({collection_name: vector_db_path})
-    
-    return merged
+    # Only the fields taken from this document are written back
+    updates = merge_user_info(current_info, flat_new_info, llm)
+    return update_user_info_json(updates, source=f"document:{doc_id}")
 
 def update_user_info_from_conversation(text, llm, current_info: dict):
     """
     Update user_info by processing conversation text.
+    Returns {"version", "changed"} with only the fields whose values changed.
     """
     if not text.strip():
         logging.warning("Empty conversation text provided, no update performed")
-        return current_info
+        return {"version": get_profile_store().version(), "changed": {}}
         
     new_info = extract_key_value_info(None, text, llm)
     logging.info(f"New info extracted from conversation: {new_info}")
@@ -565,21 +1517,164 @@ def update_user_info_from_conversation(text, llm, current_info: dict):
     flat_new_info = flatten_json(new_info)
     logging.info(f"Flattened new info: {flat_new_info}")
     
-    # Use the efficient merging function
-    merged = merge_user_info(current_info, flat_new_info, llm)
-    update_user_info_json(merged)
-    
-    return merged
+    # Only the fields taken from this turn are written back, so a stale current_info
+    # can't revert changes made since it was read
+    updates = merge_user_info(current_info, flat_new_info, llm)
+    # Conversation turns have no id of their own; the text hash identifies the turn
+    return update_user_info_json(updates, source=f"conversation:{hash_text(text)[:16]}")
 
-def answer_query(llm, question, user_info="", chat_history="", new_form=None):
+def field_tokens(text):
+    """Lowercased word tokens of a field name or form line (camelCase split), without filler words."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return {
+        token for token in re.findall(r"[a-z0-9]+", text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    }
+
+def form_field_queries(question, new_form=None):
+    """
+    Split a form's text into one search query per labelled line (deduplicated, capped at
+    RETRIEVAL_MAX_QUERIES); without a form, the question itself is the only query.
+    """
+    if not new_form:
+        return [question]
+
+    queries = []
+    seen = set()
+    for doc in new_form:
+        for line in doc.page_content.splitlines():
+            line = line.strip()
+            if not re.search(r"[A-Za-z]", line) or line.startswith("--- Page") or len(line) > 200:
+                continue
+            key = " ".join(sorted(field_tokens(line)))
+            if key and key not in seen:
+                seen.add(key)
+                queries.append(line)
+            if len(queries) >= RETRIEVAL_MAX_QUERIES:
+                return queries
+    return queries or [question]
+
+def match_profile_fields(queries, user_info):
+    """
+    Pick the user_info fields whose names share the most words with each query, keeping
+    at most RETRIEVAL_PROFILE_FIELDS_PER_QUERY per query and RETRIEVAL_MAX_PROFILE_FIELDS overall.
+    """
+    candidates = []
+    for key in user_info:
+        tokens = field_tokens(key)
+        if tokens:
+            candidates.append((key, tokens))
+
+    best_scores = {}
+    for query in queries:
+        query_tokens = field_tokens(query)
+        if not query_tokens:
+            continue
+        scored = []
+        for key, tokens in candidates:
+            shared = len(query_tokens & tokens)
+            if shared:
+                scored.append((shared / len(tokens | query_tokens), key))
+        for score, key in sorted(scored, reverse=True)[:RETRIEVAL_PROFILE_FIELDS_PER_QUERY]:
+            best_scores[key] = max(score, best_scores.get(key, 0.0))
+
+    keys = sorted(best_scores, key=lambda key: -best_scores[key])[:RETRIEVAL_MAX_PROFILE_FIELDS]
+    return {key: user_info[key] for key in keys}
+
+def fuse_rankings(ranked_lists, rrf_k=None):
+    """
+    Reciprocal rank fusion: score each hit by the sum of 1 / (rrf_k + rank) over the ranked
+    lists it appears in. Returns {id: (score, hit)}.
+    """
+    rrf_k = rrf_k or RRF_K
+    fused = {}
+    for hits in ranked_lists:
+        for rank, hit in enumerate(hits, start=1):
+            score = fused.get(hit["id"], (0.0, hit))[0] + 1.0 / (rrf_k + rank)
+            fused[hit["id"]] = (score, hit)
+    return fused
+
+def retrieve_chunks(queries, k=None, ranking=None):
+    """
+    Search the shared vector store with every query in one batch and return the best
+    distinct chunks (at most RETRIEVAL_MAX_CHUNKS) as Documents, best match first.
+    With "hybrid" ranking each query's vector hits are fused with its BM25 hits, so chunks
+    containing the exact identifiers in a query rank high even when embeddings miss them.
+    """
+    k = k or RETRIEVAL_TOP_K
+    ranking = ranking or RETRIEVAL_RANKING
+    try:
+        vector_store = get_vector_store()
+        if vector_store.count() == 0:
+            return []
+        query_vectors = get_embeddings().embed_documents(queries)
+        results = vector_store.search(query_vectors, k)
+        if ranking == "hybrid":
+            lexical_index = get_lexical_index()
+            if lexical_index.count() == 0:
+                # Stores indexed before BM25 was added; rebuilt under the write lock, like any other write
+                with current_tenant().write_lock:
+                    if lexical_index.count() == 0:
+                        rebuild_lexical_index(vector_store)
+            lexical_results = [lexical_index.search(query, k) for query in queries]
+    except Exception as e:
+        logging.error(f"Error retrieving chunks: {e}")
+        return []
+
+    best = {}
+    if ranking == "hybrid":
+        # Each chunk keeps its best fused score over all queries
+        for vector_hits, lexical_hits in zip(results, lexical_results):
+            for chunk_id, (score, hit) in fuse_rankings([vector_hits, lexical_hits]).items():
+                if chunk_id not in best or score > best[chunk_id][0]:
+                    best[chunk_id] = (score, hit)
+    else:
+        for hits in results:
+            for hit in hits:
+                if hit["id"] not in best or -hit["distance"] > best[hit["id"]][0]:
+                    best[hit["id"]] = (-hit["distance"], hit)
+    hits = [hit for _, hit in sorted(best.values(), key=lambda item: -item[0])][:RETRIEVAL_MAX_CHUNKS]
+
+    Document = lazy_import("langchain_core.documents").Document
+    logging.info(f"Retrieved {len(hits)} chunks for {len(queries)} queries")
+    return [Document(page_content=hit["text"], metadata=hit["metadata"]) for hit in hits]
+
+def format_retrieved_context(chunks):
+    """Group retrieved chunks by document and merge overlapping ones into labelled excerpts."""
+    by_doc = {}
+    for chunk in chunks:
+        by_doc.setdefault(chunk.metadata.get("doc_id", "document"), []).append(chunk)
+
+    sections = []
+    for doc_id, doc_chunks in by_doc.items():
+        text, tokens_saved = assemble_context(doc_chunks)
+        record_context_savings(tokens_saved)
+        sections.append(f"[{doc_id}]\n{text}")
+    return "\n\n".join(sections)
+
+def answer_query(llm, question, user_info="", chat_history="", new_form=None, mode=None, ranking=None,
+                 on_delta=None):
     """
     Answer a query using stored data and vector DBs of uploaded forms.
+    In "retrieval" mode only the user_info fields and document chunks relevant to the
+    question (or to each line of the new form) are put in the prompt, rather than all of them.
+    on_delta, if given, receives the answer's text as the model generates it.
     """
+    mode = mode or ANSWER_MODE
     try:
         user_info_dict = json.loads(user_info) if isinstance(user_info, str) else user_info
     except Exception as e:
         logging.error(f"Error parsing user_info: {e}")
         return "Sorry, I couldn't process your request due to an error with user information."
+
+    document_context = ""
+    if mode == "retrieval":
+        queries = form_field_queries(question, new_form)
+        user_info_dict = match_profile_fields(queries, user_info_dict or {})
+        excerpts = format_retrieved_context(retrieve_chunks(queries, ranking=ranking))
+        if excerpts:
+            document_context = f"RELEVANT EXCERPTS FROM USER DOCUMENTS:\n{excerpts}\n\n"
+        logging.info(f"Retrieval prompt uses {len(user_info_dict)} profile fields for {len(queries)} queries")
     
     if new_form:
         new_form_context = "\n".join(doc.page_content for doc in new_form)
@@ -589,6 +1684,7 @@ def answer_query(llm, question, user_info="", chat_history="", new_form=None):
             "You are Quill, an expert form-filling assistant. Your task is to generate a FLAT JSON object where keys EXACTLY match the form field names and values are accurately derived from stored user information.\n\n"
             "FORM TO COMPLETE:\n{new_form_context}\n\n"
             "USER PROFILE DATA:\n{user_info}\n\n"
+            "{document_context}"
             "CHAT HISTORY:\n{chat_history}\n\n "
             "INSTRUCTIONS:\n"
             "1. FIELD EXTRACTION:\n"
@@ -617,29 +1713,495 @@ def answer_query(llm, question, user_info="", chat_history="", new_form=None):
         prompt_text = template.format(
             new_form_context=new_form_context,
             user_info=json.dumps(user_info_dict, indent=2),
+            document_context=document_context,
             chat_history=chat_history,
             question=question
         )
     else:
-        prompt_text = "You are an expert conversational assistant. Your task is to ONLY answer questions based on stored user information otherwise request the user to upload other documents they have with relevant information (but don't name them explicitly). Do not respond with more than 1-2 sentences. \n\n" + question
+        prompt_text = "You are an expert conversational assistant. Your task is to ONLY answer questions based on stored user information otherwise request the user to upload other documents they have with relevant information (but don't name them explicitly). Do not respond with more than 1-2 sentences. \n\n"
+        if mode == "retrieval":
+            prompt_text += f"USER PROFILE DATA:\n{json.dumps(user_info_dict, indent=2)}\n\n{document_context}QUESTION: "
+        prompt_text += question
     
-    response = llm.invoke(input=prompt_text)
-    return response.content.strip()
+    return invoke_llm(llm, prompt_text, on_delta).strip()
+
+
+## Request Handlers
+
+def run_ingest(document=None, **_):
+    """Ingest a document into user_info.json and its vector DB; return the JSON result."""
+    if not document:
+        return {"error": "Document is required for ingest mode"}
+
+    # An identical file that is already indexed needs neither OCR, embedding nor extraction
+    content_hash = hash_file(document) if os.path.exists(document) else None
+    if content_hash:
+        duplicates = get_document_registry().find_by_hash(content_hash, status="indexed")
+        if duplicates:
+            logging.info(f"{document} is already ingested as '{duplicates[0]['doc_id']}'")
+            return {
+                "status": "success",
+                "message": "Document was already processed",
+                "duplicate_of": duplicates[0]["doc_id"],
+                "extracted_info": {}
+            }
+
+    # Process document, indexing each page's chunks into the shared vector store as it is read
+    llm = get_llm()
+    with ChunkExtractor(llm) as extractor:
+        doc_id, chunks, vector_db = index_document(document, extractor, content_hash)
+        if chunks is None:
+            return {"error": "Failed to ingest document"}
+        key_value_info = extractor.result()
+    logging.info(f"Extracted key-value pairs: {key_value_info}")
+
+    # Flatten any nested structures before saving
+    flat_key_value_info = flatten_json(key_value_info)
+    changes = update_user_info_json(flat_key_value_info, source=f"document:{doc_id}")
+
+    if vector_db:
+        return {
+            "status": "success",
+            "message": "Document processed successfully",
+            "doc_id": doc_id,
+            "extracted_info": flat_key_value_info,
+            "changed_fields": changes["changed"],
+            "profile_version": changes["version"]
+        }
+    return {
+        "status": "partial_success",
+        "message": "Document processed but vector database creation failed",
+        "extracted_info": flat_key_value_info,
+        "changed_fields": changes["changed"],
+        "profile_version": changes["version"]
+    }
+
+def run_query(question=None, document=None, chat_history=None, answer_mode=None, retrieval_ranking=None,
+              on_delta=None, **_):
+    """
+    Answer a question, optionally against a new form document; return the JSON result.
+    on_delta, if given, receives the answer's text as the model generates it.
+    """
+    if not question:
+        return {"error": "Question is required for query mode"}
+
+    # Load stored user info
+    user_info = load_user_info()
+
+    # Get chat history if provided
+    formatted_history = ""
+    if chat_history:
+        formatted_history = format_chat_history(chat_history)
+
+    llm = get_llm()
+
+    if document:
+        data = ingest_file(document)
+        response = answer_query(llm, question, user_info, formatted_history, data,
+                                mode=answer_mode, ranking=retrieval_ranking, on_delta=on_delta)
+    else:
+        response = answer_query(llm, question, user_info, formatted_history,
+                                mode=answer_mode, ranking=retrieval_ranking, on_delta=on_delta)
+
+    return {"response": response}
+
+def run_update(document=None, question=None, **_):
+    """Update user info from a document or conversation text; return the JSON result."""
+    # Load current user info
+    current_info = load_user_info()
+    if not current_info:
+        return {"error": "No user information found. Run in 'ingest' mode first."}
+
+    llm = get_llm()
+
+    if document:
+        # Update via document; only the fields that changed are returned
+        changes = update_user_info_from_doc(document, llm, current_info)
+        return {
+            "status": "success",
+            "message": "Your info has been updated from your document.",
+            "updated_info": changes["changed"],
+            "profile_version": changes["version"]
+        }
+    if question:  # Repurpose question arg for conversation text in update mode
+        # Update via conversation text
+        changes = update_user_info_from_conversation(question, llm, current_info)
+        return {
+            "status": "success",
+            "message": "Your info has been updated from our conversation.",
+            "updated_info": changes["changed"],
+            "profile_version": changes["version"]
+        }
+    return {"error": "Document or question required for update mode"}
+
+CACHES = {
+    "ocr": get_ocr_cache,
+    "llm": get_llm_cache,
+    "embeddings": get_embedding_cache,
+}
+
+def run_cache(cache_action="stats", cache_name="all", document=None, **_):
+    """Inspect or purge the on-disk caches; OCR purges can be limited to one document."""
+    names = sorted(CACHES) if cache_name == "all" else [cache_name]
+    if any(name not in CACHES for name in names):
+        return {"error": f"Unknown cache: {cache_name}"}
+
+    if cache_action == "stats":
+        return {"status": "success", "caches": {name: CACHES[name]().stats() for name in names}}
+    if cache_action == "purge":
+        prefix = None
+        if document:
+            if names != ["ocr"]:
+                return {"error": "Purging by document is only supported for the ocr cache"}
+            if not os.path.exists(document):
+                return {"error": f"File not found: {document}"}
+            prefix = f"{hash_file(document)}|"
+        removed = {name: CACHES[name]().purge(prefix) for name in names}
+        return {
+            "status": "success",
+            "removed_entries": removed,
+            "caches": {name: CACHES[name]().stats() for name in names},
+        }
+    return {"error": f"Unsupported cache action: {cache_action}"}
+
+def run_migrate(remove_old=False, **_):
+    """Move chunks from the old one-directory-per-upload layout into the shared vector store."""
+    vector_store = get_vector_store()
+    try:
+        migrated = migrate_per_document_stores(vector_store, current_tenant().vector_db_dir, remove_old=remove_old)
+    except Exception as e:
+        logging.error(f"Error migrating vector databases: {e}")
+        return {"error": f"Failed to migrate vector databases: {e}"}
+
+    # Register migrated documents and drop their old paths from user_info.json
+    registry = get_document_registry()
+    for doc_id, chunk_count in migrated.items():
+        registry.upsert(
+            doc_id,
+            collection=os.path.basename(vector_store.persist_dir),
+            source=doc_id,
+            chunk_count=chunk_count,
+            status="indexed",
+        )
+    get_profile_store().export()
+    if migrated:
+        rebuild_lexical_index(vector_store)
+
+    return {
+        "status": "success",
+        "migrated_chunks": migrated,
+        "total_chunks": vector_store.count(),
+        "removed_old": bool(remove_old),
+    }
+
+def run_compact(**_):
+    """
+    Rebuild the vector store with only the chunks of documents the registry lists as indexed,
+    dropping deleted, replaced and orphaned chunks; report the bytes reclaimed.
+    """
+    vector_store = get_vector_store()
+    keep_doc_ids = {entry["doc_id"] for entry in get_document_registry().list(status="indexed")}
+    if not keep_doc_ids and vector_store.count():
+        # Stores built before the registry existed would otherwise be wiped entirely
+        return {"error": "No indexed documents are registered; run --mode migrate before compacting"}
+
+    bytes_before = directory_size(vector_store.persist_dir)
+    try:
+        compacted = vector_store.compact(keep_doc_ids)
+        rebuild_lexical_index(vector_store)
+    except Exception as e:
+        logging.error(f"Error compacting vector store: {e}")
+        return {"error": f"Failed to compact vector store: {e}"}
+    bytes_after = directory_size(vector_store.persist_dir)
+
+    logging.info(f"Compacted {vector_store.persist_dir}: {bytes_before} -> {bytes_after} bytes")
+    return {
+        "status": "success",
+        **compacted,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_reclaimed": max(bytes_before - bytes_after, 0),
+    }
+
+def run_profile(since_version=None, field=None, **_):
+    """
+    Show profile fields with their provenance, only the changes after since_version,
+    or one field's full history.
+    """
+    store = get_profile_store()
+    if field:
+        history = store.field_history(field)
+        if not history:
+            return {"error": f"Unknown profile field: {field}"}
+        return {"status": "success", "field": field, "history": history}
+    if since_version is not None:
+        return {"status": "success", "since_version": since_version, **store.changes_since(since_version)}
+    return {"status": "success", "version": store.version(), "fields": store.get_with_provenance()}
+
+def run_documents(document=None, **_):
+    """List the documents in the registry, or show the one matching --document."""
+    registry = get_document_registry()
+    if document:
+        doc_id = sanitize_collection_name(os.path.splitext(os.path.basename(document))[0])
+        entry = registry.get(doc_id)
+        if entry is None:
+            return {"error": f"Document not found: {doc_id}"}
+        return {"status": "success", "document": entry}
+    documents = registry.list()
+    return {"status": "success", "count": len(documents), "documents": documents}
+
+def run_delete(document=None, **_):
+    """Remove the document matching --document from the vector store, BM25 index and registry."""
+    if not document:
+        return {"error": "Document path or name is required for delete mode"}
+    doc_id = sanitize_collection_name(os.path.splitext(os.path.basename(document))[0])
+    registry = get_document_registry()
+    chunk_ids = get_vector_store().chunk_ids(doc_id)
+    if registry.get(doc_id) is None and not chunk_ids:
+        return {"error": f"Document not found: {doc_id}"}
+
+    discard_chunks(chunk_ids)
+    persist_vector_store()
+    registry.delete(doc_id)
+    logging.info(f"Deleted document '{doc_id}' ({len(chunk_ids)} chunks)")
+    return {"status": "success", "doc_id": doc_id, "deleted_chunks": len(chunk_ids)}
+
+MODE_HANDLERS = {
+    "ingest": run_ingest,
+    "query": run_query,
+    "update": run_update,
+    "cache": run_cache,
+    "migrate": run_migrate,
+    "documents": run_documents,
+    "delete": run_delete,
+    "compact": run_compact,
+    "profile": run_profile,
+}
+
+# Modes that rewrite user_info.json or the vector store; serialized when serving
+WRITE_MODES = {"ingest", "update", "migrate", "delete", "compact"}
+# Modes that call the LLM and report cache hits/misses
+LLM_MODES = {"ingest", "query", "update"}
+
+def handle_request(mode, payload):
+    """Dispatch a JSON payload (user_id, document, question, chat_history) to a mode handler."""
+    handler = MODE_HANDLERS.get(mode)
+    if handler is None:
+        return {"error": f"Unsupported mode: {mode}"}
+    if not isinstance(payload, dict):
+        return {"error": "Request payload must be a JSON object"}
+
+    payload = dict(payload)
+    reset_request_stats(llm_cache_enabled=not payload.pop("no_llm_cache", False))
+    try:
+        _request_state.tenant = get_tenant(payload.pop("user_id", None))
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        return _handle_tenant_request(mode, handler, payload)
+    finally:
+        _request_state.tenant = None
+
+def _handle_tenant_request(mode, handler, payload):
+    """Run a handler for the tenant already set on this thread and attach per-request stats."""
+    if mode in WRITE_MODES:
+        with current_tenant().write_lock:
+            result = handler(**payload)
+    else:
+        result = handler(**payload)
+
+    if mode in LLM_MODES:
+        result["llm_cache"] = llm_cache_stats()
+        result["context_tokens_saved"] = _request_state.context_stats["tokens_saved"]
+    if mode in LLM_MODES and "profile_version" not in result:
+        # Lets callers cache answers per profile version instead of invalidating wholesale
+        result["profile_version"] = get_profile_store().version()
+    if _request_state.embedding_stats is not None:
+        result["embedding"] = _request_state.embedding_stats
+    return result
+
+class DeltaStream:
+    """
+    Writes a streamed query answer as newline-delimited JSON: a {"type": "delta"} record per piece
+    of text as the model generates it, then a {"type": "summary"} record with the usual result
+    and the time to first token measured from the start of the request.
+    """
+
+    def __init__(self, write, flush=None):
+        self._write = write
+        self._flush = flush
+        self.start = time.perf_counter()
+        self.ttft_seconds = None
+        self.deltas = 0
+
+    def _emit(self, record):
+        self._write(json.dumps(record) + "\n")
+        if self._flush:
+            self._flush()
+
+    def delta(self, text):
+        if not text:
+            return
+        if self.ttft_seconds is None:
+            self.ttft_seconds = round(time.perf_counter() - self.start, 4)
+        self.deltas += 1
+        self._emit({"type": "delta", "content": text})
+
+    def summary(self, result):
+        self._emit({
+            "type": "summary",
+            **result,
+            "stream": {
+                "ttft_seconds": self.ttft_seconds,
+                "total_seconds": round(time.perf_counter() - self.start, 4),
+                "deltas": self.deltas,
+            },
+        })
+
+## Server Mode
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler exposing POST /<mode> with the same JSON payloads as the CLI."""
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "modes": sorted(MODE_HANDLERS),
+                "open_tenants": len(_tenants),
+                "llm": lazy_import("common.llm_client").metrics_snapshot(),
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def _stream_query(self, payload):
+        """Answer a query as NDJSON deltas followed by a summary record (see DeltaStream)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        stream = DeltaStream(lambda line: self.wfile.write(line.encode("utf-8")), self.wfile.flush)
+        try:
+            try:
+                result = handle_request("query", {**payload, "on_delta": stream.delta})
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                logging.error(f"Error handling streamed query request: {e}")
+                result = {"error": f"Failed to process query request: {e}"}
+            stream.summary(result)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Client disconnected from streamed query")
+
+    def do_POST(self):
+        mode = self.path.strip("/")
+        if mode not in MODE_HANDLERS:
+            self._send_json(404, {"error": f"Unknown mode: {mode}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": f"Invalid JSON payload: {e}"})
+            return
+
+        if mode == "query" and isinstance(payload, dict) and payload.pop("stream", False):
+            self._stream_query(payload)
+            return
+
+        try:
+            result = handle_request(mode, payload)
+        except TypeError as e:
+            self._send_json(400, {"error": f"Invalid request fields: {e}"})
+            return
+        except Exception as e:
+            logging.error(f"Error handling {mode} request: {e}")
+            self._send_json(500, {"error": f"Failed to process {mode} request: {e}"})
+            return
+
+        self._send_json(400 if "error" in result else 200, result)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+def serve(host=SERVE_HOST, port=SERVE_PORT):
+    """Run a long-lived local server that keeps the LLM, embeddings and vector DBs warm."""
+    # Import dependencies and build the clients up front so the first request doesn't pay for them
+    warm_imports()
+    get_llm()
+    get_embeddings()
+    logging.info(f"Startup report: {json.dumps(startup_report())}")
+
+    server = ThreadingHTTPServer((host, port), RAGRequestHandler)
+    logging.info(f"Quill RAG server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down Quill RAG server")
+    finally:
+        server.server_close()
+
+def configure_ocr(workers, max_pages_in_flight, mode=None, confidence_threshold=None):
+    """Override the OCR worker count, in-flight page limit and DPI strategy for this process."""
+    global OCR_WORKERS, OCR_MAX_PAGES_IN_FLIGHT, OCR_MODE, OCR_CONFIDENCE_THRESHOLD
+    OCR_WORKERS = max(workers, 1)
+    OCR_MAX_PAGES_IN_FLIGHT = max(max_pages_in_flight, 1)
+    if mode:
+        OCR_MODE = mode
+    if confidence_threshold is not None:
+        OCR_CONFIDENCE_THRESHOLD = confidence_threshold
+
+def configure_vector_backend(backend):
+    """Choose the vector store backend for this process (before the store is first opened)."""
+    global VECTOR_BACKEND
+    VECTOR_BACKEND = backend
+
+def configure_tenants(cache_size):
+    """Override how many users' stores serve mode keeps open."""
+    global TENANT_CACHE_SIZE
+    TENANT_CACHE_SIZE = max(cache_size, 1)
+
+def configure_embeddings(batch_size, workers):
+    """Override the embeddings batch size and request concurrency for this process."""
+    global EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS
+    EMBEDDING_BATCH_SIZE = max(batch_size, 1)
+    EMBEDDING_WORKERS = max(workers, 1)
+
+def configure_extraction(mode, concurrency):
+    """Override the key-value extraction strategy and its parallelism for this process."""
+    global EXTRACTION_MODE, EXTRACTION_CONCURRENCY
+    EXTRACTION_MODE = mode
+    EXTRACTION_CONCURRENCY = max(concurrency, 1)
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Run in multiple modes: ingest (update user_info.json), query (answer questions), or update (update user info)."
+        description="Run in multiple modes: ingest (update user_info.json), query (answer questions), update (update user info), or serve (long-lived local server)."
     )
     parser.add_argument(
         "--mode",
-        choices=["ingest", "query", "update"],
+        choices=["ingest", "query", "update", "cache", "migrate", "documents", "delete", "compact", "profile",
+                 "serve"],
         required=True,
-        help="Mode: 'ingest' to process a file and update user info; 'query' to answer questions; 'update' to update user info."
+        help="Mode: 'ingest' to process a file and update user info; 'query' to answer questions; 'update' to update user info; 'cache' to inspect or purge the OCR, LLM and embedding caches; 'migrate' to move per-document vector DBs into the shared store; 'documents' to list ingested documents; 'delete' to remove the document named by --document; 'compact' to rebuild the vector store without stale chunks; 'profile' to show profile fields with provenance or changes since a version; 'serve' to expose the other modes over HTTP."
+    )
+    parser.add_argument(
+        "--user-id",
+        type=str,
+        help="User whose profile and documents to use (stored under uploads/tenants/); omit for the single-user layout"
     )
     parser.add_argument(
         "--document",
         type=str,
-        help="Path to the document file for ingest and update modes"
+        help="Path to the document file for ingest and update modes, or the document to show or delete"
     )
     parser.add_argument(
         "--question",
@@ -651,103 +2213,171 @@ def main():
         type=str,
         help="Path to chat history JSON file for query mode"
     )
+    parser.add_argument(
+        "--cache-action",
+        choices=["stats", "purge"],
+        default="stats",
+        help="Cache mode: show cache statistics or purge entries (only --document's OCR entries if given)"
+    )
+    parser.add_argument(
+        "--cache-name",
+        choices=["all", "ocr", "llm", "embeddings"],
+        default="all",
+        help="Cache mode: which cache to inspect or purge"
+    )
+    parser.add_argument(
+        "--vector-backend",
+        choices=["chroma", "numpy"],
+        default=VECTOR_BACKEND,
+        help="Vector store backend: 'chroma', or 'numpy' for an in-process exact cosine index (faster to load for small stores)"
+    )
+    parser.add_argument(
+        "--answer-mode",
+        choices=["retrieval", "full"],
+        default=ANSWER_MODE,
+        help="Query mode: 'retrieval' prompts with only the top-k relevant chunks and profile fields per question or form field; 'full' includes all of user_info"
+    )
+    parser.add_argument(
+        "--retrieval-ranking",
+        choices=["hybrid", "vector"],
+        default=RETRIEVAL_RANKING,
+        help="Retrieval answer mode: 'hybrid' fuses BM25 keyword and vector rankings (best for exact identifiers); 'vector' uses embeddings only"
+    )
+    parser.add_argument(
+        "--since-version",
+        type=int,
+        help="Profile mode: only show fields changed after this profile version"
+    )
+    parser.add_argument(
+        "--field",
+        type=str,
+        help="Profile mode: show the full history of one field"
+    )
+    parser.add_argument(
+        "--remove-old",
+        action="store_true",
+        help="Migrate mode: delete each per-document vector DB directory after copying it"
+    )
+    parser.add_argument(
+        "--extraction-mode",
+        choices=["map_reduce", "single"],
+        default=EXTRACTION_MODE,
+        help="'map_reduce' extracts token-budgeted chunk groups concurrently and merges them; 'single' uses one prompt"
+    )
+    parser.add_argument(
+        "--extraction-concurrency",
+        type=int,
+        default=EXTRACTION_CONCURRENCY,
+        help="Maximum concurrent extraction calls in map_reduce mode"
+    )
+    parser.add_argument(
+        "--embedding-batch-size",
+        type=int,
+        default=EMBEDDING_BATCH_SIZE,
+        help="Number of chunks sent per embeddings request"
+    )
+    parser.add_argument(
+        "--embedding-workers",
+        type=int,
+        default=EMBEDDING_WORKERS,
+        help="Maximum concurrent embeddings requests"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Query mode: print the answer as newline-delimited JSON deltas as it is generated, then a summary record"
+    )
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Bypass the LLM response cache for this request"
+    )
+    parser.add_argument(
+        "--tenant-cache-size",
+        type=int,
+        default=TENANT_CACHE_SIZE,
+        help="Serve mode: number of users whose vector store, registry and profile store stay open"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=SERVE_HOST,
+        help="Interface to bind in serve mode"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=SERVE_PORT,
+        help="Port to listen on in serve mode"
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="Print per-import wall time and total elapsed time to stderr as JSON"
+    )
+    parser.add_argument(
+        "--ocr-workers",
+        type=int,
+        default=OCR_WORKERS,
+        help="Number of OCR worker processes (defaults to the CPU count)"
+    )
+    parser.add_argument(
+        "--ocr-max-pages-in-flight",
+        type=int,
+        default=OCR_MAX_PAGES_IN_FLIGHT,
+        help="Maximum number of PDF pages queued or being OCR'd at once"
+    )
+    parser.add_argument(
+        "--ocr-mode",
+        choices=["fixed", "adaptive"],
+        default=OCR_MODE,
+        help="'fixed' OCRs every page at 900 DPI; 'adaptive' starts at 300 DPI and re-renders only low-confidence pages"
+    )
+    parser.add_argument(
+        "--ocr-confidence-threshold",
+        type=float,
+        default=OCR_CONFIDENCE_THRESHOLD,
+        help="Mean Tesseract word confidence (0-100) below which adaptive OCR escalates the DPI"
+    )
     
     args = parser.parse_args()
+    if args.stream and args.mode != "query":
+        parser.error("--stream is only supported in query mode")
+    configure_ocr(args.ocr_workers, args.ocr_max_pages_in_flight,
+                  args.ocr_mode, args.ocr_confidence_threshold)
+    configure_extraction(args.extraction_mode, args.extraction_concurrency)
+    configure_embeddings(args.embedding_batch_size, args.embedding_workers)
+    configure_vector_backend(args.vector_backend)
+    configure_tenants(args.tenant_cache_size)
     
-    if args.mode == "ingest":
-        if not args.document:
-            print(json.dumps({"error": "Document is required for ingest mode"}))
-            return
-            
-        # Process document
-        data = ingest_file(args.document)
-        if data is None:
-            print(json.dumps({"error": "Failed to ingest document"}))
-            return
-            
-        chunks = split_documents(data)
-        llm = ChatOllama(model=MODEL_NAME, temperature=0.3)
-        key_value_info = extract_key_value_info(chunks, None, llm)
-        logging.info(f"Extracted key-value pairs: {key_value_info}")
-        
-        # Flatten any nested structures before saving
-        flat_key_value_info = flatten_json(key_value_info)
-        update_user_info_json(flat_key_value_info)
-        
-        # Create and store vector DB
-        filename = os.path.basename(args.document)
-        collection_name = sanitize_collection_name(os.path.splitext(filename)[0])
-        vector_db = create_vector_db(chunks, collection_name)
-        
-        if vector_db:
-            vector_db_path = os.path.join(VECTOR_DB_DIR, collection_name)
-            update_user_info_json({collection_name: vector_db_path})
-            
-            print(json.dumps({
-                "status": "success",
-                "message": "Document processed successfully",
-                "extracted_info": flat_key_value_info
-            }))
-        else:
-            print(json.dumps({
-                "status": "partial_success",
-                "message": "Document processed but vector database creation failed",
-                "extracted_info": flat_key_value_info
-            }))
-    
-    elif args.mode == "query":
-        if not args.question:
-            print(json.dumps({"error": "Question is required for query mode"}))
-            return
-        
-        # Load stored user info
-        user_info = load_user_info()
+    if args.mode == "serve":
+        serve(args.host, args.port)
+        return
 
-        # Get chat history if provided
-        chat_history = ""
-        if args.chat_history:
-            chat_history = format_chat_history(args.chat_history)
-
-        # Initialize LLM and get response
-        llm = ChatOllama(model=MODEL_NAME, temperature=0.3)
+    stream = DeltaStream(sys.stdout.write, sys.stdout.flush) if args.stream else None
+    result = handle_request(args.mode, {
+        "on_delta": stream.delta if stream else None,
+        "user_id": args.user_id,
+        "document": args.document,
+        "question": args.question,
+        "chat_history": args.chat_history,
+        "cache_action": args.cache_action,
+        "cache_name": args.cache_name,
+        "no_llm_cache": args.no_llm_cache,
+        "remove_old": args.remove_old,
+        "answer_mode": args.answer_mode,
+        "retrieval_ranking": args.retrieval_ranking,
+        "since_version": args.since_version,
+        "field": args.field,
+    })
+    if stream:
+        stream.summary(result)
+    else:
+        print(json.dumps(result))
 
-        if args.document:
-            data = ingest_file(args.document)
-            response = answer_query(llm, args.question, user_info, chat_history, data)
-        else:
-            response = answer_query(llm, args.question, user_info, chat_history)
-        
-        print(json.dumps({"response": response}))
-    
-    elif args.mode == "update":
-        # Load current user info
-        current_info = load_user_info()
-        if not current_info:
-            print(json.dumps({"error": "No user information found. Run in 'ingest' mode first."}))
-            return
-            
-        llm = ChatOllama(model=MODEL_NAME, temperature=0.3)
-        
-        if args.document:
-            # Update via document
-            file_path = args.document
-            updated_info = update_user_info_from_doc(file_path, llm, current_info)
-            print(json.dumps({
-                "status": "success",
-                "message": "Your info has been updated from your document.",
-                "updated_info": updated_info
-            }))
-        elif args.question:  # Repurpose question arg for conversation text in update mode
-            # Update via conversation text
-            text = args.question
-            updated_info = update_user_info_from_conversation(text, llm, current_info)
-            print(json.dumps({
-                "status": "success",
-                "message": "Your info has been updated from our conversation.",
-                "updated_info": updated_info
-            }))
-        else:
-            print(json.dumps({"error": "Document or question required for update mode"}))
+    if args.startup_report:
+        # Kept off stdout so callers can still parse the result as a single JSON object
+        print(json.dumps({"startup_report": startup_report()}), file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,634 @@
+"""
+Shared per-user vector store for quill_rag_v4.py.
+Every uploaded document's chunks live in one collection and are tagged with
+doc_id/source/page metadata, so a single store can be searched across all documents
+and a document's chunks can be added, deleted or replaced on their own.
+Two interchangeable backends are provided: Chroma, and a brute-force NumPy index that
+avoids Chroma's start-up cost for stores of a few thousand chunks.
+"""
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+USER_COLLECTION = "user_documents"   # Name of the shared collection (and its persist dir)
+NUMPY_EMBEDDINGS_FILE = "embeddings.npy"
+NUMPY_METADATA_FILE = "metadata.json"
+STORE_LOCK_FILE = "store.lock"
+COMPACT_CHUNKS_KEY = "compact_chunks"   # Staging collection metadata: how many chunks a complete copy holds
+CHROMA_ADD_BATCH_SIZE = 5000          # Stay under chromadb's maximum batch size
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold an advisory lock on path (created if missing) against other processes."""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        else:
+            # msvcrt has no shared locks; every holder locks the first byte exclusively
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def chunk_metadata(doc_id, chunk):
+    """Return Chroma-safe metadata for a chunk tagged with its document id."""
+    metadata = {"doc_id": doc_id}
+    for key, value in (chunk.metadata or {}).items():
+        # Chroma only accepts scalar metadata values
+        if isinstance(value, (str, int, float, bool)):
+            metadata[key] = value
+    metadata.setdefault("source", doc_id)
+    return metadata
+
+
+class ChromaDocumentStore:
+    """
+    One persisted Chroma collection holding the chunks of every document for a user.
+    compact() copies the kept chunks to a staging collection before dropping the main one;
+    opening the store finishes a compaction interrupted after that copy and discards a partial one.
+    """
+
+    def __init__(self, persist_dir, embeddings, collection_name=USER_COLLECTION):
+        from langchain_community.vectorstores import Chroma
+
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self._staging_name = f"{collection_name}_compact"
+        self._lock_path = os.path.join(persist_dir, STORE_LOCK_FILE)
+        self.vector_db = Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_dir,
+        )
+        if self._staging_collection() is not None:
+            with file_lock(self._lock_path):
+                self._recover_compaction()
+
+    @property
+    def collection(self):
+        return self.vector_db._collection
+
+    def add_chunks(self, doc_id, chunks):
+        """Embed and append chunks for doc_id; returns the new chunk ids."""
+        if not chunks:
+            return []
+        ids = [f"{doc_id}:{uuid.uuid4().hex}" for _ in chunks]
+        self.vector_db.add_texts(
+            texts=[chunk.page_content for chunk in chunks],
+            metadatas=[chunk_metadata(doc_id, chunk) for chunk in chunks],
+            ids=ids,
+        )
+        return ids
+
+    def chunk_ids(self, doc_id):
+        """Return the ids of every chunk stored for doc_id."""
+        return self.collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+
+    def delete_chunks(self, ids):
+        """Remove chunks by id; returns how many were deleted."""
+        if ids:
+            self.collection.delete(ids=list(ids))
+        return len(ids)
+
+    def delete_document(self, doc_id):
+        """Remove every chunk belonging to doc_id; returns how many were deleted."""
+        deleted = self.delete_chunks(self.chunk_ids(doc_id))
+        if deleted:
+            logging.info(f"Deleted {deleted} chunks for document '{doc_id}'")
+        return deleted
+
+    def count(self, doc_id=None):
+        """Number of chunks in the store, or for one document."""
+        if doc_id is None:
+            return self.collection.count()
+        return len(self.chunk_ids(doc_id))
+
+    def search(self, query_embeddings, k, doc_ids=None):
+        """
+        Nearest chunks for several query vectors in one call. Returns, per query, a list of
+        {"id", "text", "metadata", "distance"} dicts ordered from closest to farthest.
+        """
+        total = self.collection.count()
+        if not query_embeddings or total == 0:
+            return [[] for _ in query_embeddings]
+        where = {"doc_id": {"$in": list(doc_ids)}} if doc_ids else None
+        results = self.collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=min(k, total),
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [
+                {"id": chunk_id, "text": text, "metadata": meta or {}, "distance": distance}
+                for chunk_id, text, meta, distance in zip(ids, texts, metas, distances)
+            ]
+            for ids, texts, metas, distances in zip(
+                results["ids"], results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
+    def persist(self):
+        # Chroma >= 0.4 persists automatically; older clients need an explicit call
+        if hasattr(self.vector_db, "persist"):
+            self.vector_db.persist()
+
+    def add_embedded(self, ids, embeddings, texts, metadatas):
+        """Store chunks whose embeddings were already computed (used by migration)."""
+        self._add_batches(self.collection, list(ids), list(embeddings), list(texts), list(metadatas))
+
+    def all_chunks(self):
+        """Return (ids, texts, metadatas) for every stored chunk."""
+        data = self.collection.get(include=["documents", "metadatas"])
+        return data["ids"], data["documents"], [meta or {} for meta in data["metadatas"]]
+
+    def compact(self, keep_doc_ids):
+        """
+        Rebuild the collection with only the chunks of keep_doc_ids, so deleted and orphaned
+        chunks no longer take space in the HNSW index or the SQLite file.
+        Returns {"kept_chunks", "removed_chunks", "removed_doc_ids"}.
+        """
+        with file_lock(self._lock_path):
+            self._recover_compaction()
+            data = self.collection.get(include=["documents", "metadatas", "embeddings"])
+            keep = [i for i, meta in enumerate(data["metadatas"]) if (meta or {}).get("doc_id") in keep_doc_ids]
+            removed_doc_ids = sorted({
+                (meta or {}).get("doc_id") or "" for meta in data["metadatas"]
+                if (meta or {}).get("doc_id") not in keep_doc_ids
+            })
+            records = (
+                [data["ids"][i] for i in keep],
+                [data["embeddings"][i] for i in keep],
+                [data["documents"][i] for i in keep],
+                [data["metadatas"][i] for i in keep],
+            )
+
+            # Copy the kept chunks to a staging collection first; until it is dropped, a crash
+            # leaves a complete copy that the next open restores the collection from
+            client = self.vector_db._client
+            staging = client.create_collection(self._staging_name, metadata={COMPACT_CHUNKS_KEY: len(keep)})
+            self._add_batches(staging, *records)
+            self._replace_collection(*records)
+            client.delete_collection(self._staging_name)
+
+            conn = sqlite3.connect(os.path.join(self.persist_dir, "chroma.sqlite3"), timeout=30)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return {
+            "kept_chunks": len(keep),
+            "removed_chunks": len(data["ids"]) - len(keep),
+            "removed_doc_ids": removed_doc_ids,
+        }
+
+    def _staging_collection(self):
+        """The staging collection left by an interrupted compact(), or None."""
+        try:
+            return self.vector_db._client.get_collection(self._staging_name)
+        except Exception:   # ValueError or NotFoundError, depending on the chromadb version
+            return None
+
+    def _recover_compaction(self):
+        """
+        Deal with a staging collection left by an interrupted compact(); the caller holds the lock.
+        A complete copy replaces the collection, which may already have been dropped or partly
+        refilled; a partial copy is discarded, since the collection was not touched yet.
+        """
+        staging = self._staging_collection()
+        if staging is None:
+            return
+        if staging.count() == (staging.metadata or {}).get(COMPACT_CHUNKS_KEY):
+            data = staging.get(include=["documents", "metadatas", "embeddings"])
+            self._replace_collection(data["ids"], list(data["embeddings"]), data["documents"], data["metadatas"])
+            logging.info(f"Finished an interrupted compaction of {self.persist_dir}")
+        else:
+            logging.info(f"Discarded a partial compaction copy in {self.persist_dir}")
+        self.vector_db._client.delete_collection(self._staging_name)
+
+    def _replace_collection(self, ids, embeddings, texts, metadatas):
+        """Drop the collection and recreate it holding exactly the given chunks."""
+        from langchain_community.vectorstores import Chroma
+
+        self.vector_db._client.delete_collection(self.collection_name)
+        self.vector_db = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=self.persist_dir,
+        )
+        self._add_batches(self.collection, ids, embeddings, texts, metadatas)
+
+    @staticmethod
+    def _add_batches(collection, ids, embeddings, texts, metadatas):
+        for i in range(0, len(ids), CHROMA_ADD_BATCH_SIZE):
+            end = i + CHROMA_ADD_BATCH_SIZE
+            collection.add(ids=ids[i:end], embeddings=embeddings[i:end],
+                           documents=texts[i:end], metadatas=metadatas[i:end])
+
+    def as_retriever(self, doc_ids=None, **kwargs):
+        """Retriever over all documents, or only the given doc_ids."""
+        if doc_ids:
+            search_kwargs = dict(kwargs.pop("search_kwargs", {}))
+            search_kwargs["filter"] = {"doc_id": {"$in": list(doc_ids)}}
+            kwargs["search_kwargs"] = search_kwargs
+        return self.vector_db.as_retriever(**kwargs)
+
+
+class NumpyDocumentStore:
+    """
+    Exact cosine-similarity index kept in persist_dir as a float32 embeddings.npy matrix
+    (memory-mapped on load, rows L2-normalized) plus a metadata.json sidecar holding each
+    row's id, text and metadata. Deleted rows are tombstoned and dropped the next time
+    the matrix is rewritten. Added vectors are buffered in memory (and searchable right
+    away) until persist() writes them, so ingesting a document page by page rewrites the
+    matrix once rather than once per page.
+    Processes sharing persist_dir load and write under a lock on store.lock; if another
+    process wrote the store since it was read, persist() reloads it and reapplies this
+    process's additions and deletions on top, so concurrent uploads don't overwrite each other.
+    """
+
+    def __init__(self, persist_dir, embeddings, collection_name=USER_COLLECTION):
+        import numpy as np
+
+        self.np = np
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self._lock = threading.RLock()
+        os.makedirs(persist_dir, exist_ok=True)
+        self._matrix_path = os.path.join(persist_dir, NUMPY_EMBEDDINGS_FILE)
+        self._metadata_path = os.path.join(persist_dir, NUMPY_METADATA_FILE)
+        self._lock_path = os.path.join(persist_dir, STORE_LOCK_FILE)
+        with file_lock(self._lock_path, shared=True):
+            self._load()
+
+    def _disk_signature(self):
+        """Identifies the sidecar on disk; every write replaces the file and so changes it."""
+        try:
+            stat = os.stat(self._metadata_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """Read the store from disk, discarding unwritten changes; the caller holds the file lock."""
+        np = self.np
+        self.matrix = None
+        self._pending = []      # Normalized vectors added since the last persist(), in row order
+        self.ids, self.texts, self.metadatas, deleted = [], [], [], []
+        if os.path.exists(self._metadata_path) and os.path.exists(self._matrix_path):
+            with open(self._metadata_path, "r") as f:
+                sidecar = json.load(f)
+            self.ids = sidecar["ids"]
+            self.texts = sidecar["texts"]
+            self.metadatas = sidecar["metadatas"]
+            deleted = sidecar.get("deleted", [])
+            # An empty .npy can't be memory-mapped
+            self.matrix = np.load(self._matrix_path, mmap_mode="r") if self.ids else None
+        self._valid = np.ones(len(self.ids), dtype=bool)   # False for tombstoned rows
+        self._valid[np.asarray(deleted, dtype=np.intp)] = False
+        self._reset_saved_state()
+
+    def _reset_saved_state(self):
+        """Mark the in-memory rows as matching the files on disk and rebuild the lookups."""
+        self._saved_rows = len(self.ids)   # Rows present in the files on disk
+        self._deleted_ids = set()          # Ids of saved rows tombstoned since
+        self._dirty = False
+        self._signature = self._disk_signature()
+        self._rows, self._doc_rows = {}, {}
+        for row in self.np.flatnonzero(self._valid).tolist():
+            self._rows[self.ids[row]] = row
+            self._doc_rows.setdefault(self.metadatas[row].get("doc_id"), []).append(row)
+
+    def _normalize(self, vectors):
+        np = self.np
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _write(self, keep=None):
+        """
+        Atomically rewrite the sidecar, and with keep (the rows to retain) the matrix too,
+        then remap the matrix. The caller holds the file lock.
+        """
+        np = self.np
+        if keep is not None:
+            full_matrix = self._full_matrix()
+            if len(keep):
+                matrix = np.asarray(full_matrix[keep])
+            else:
+                matrix = np.zeros((0, full_matrix.shape[1] if full_matrix is not None else 0), dtype=np.float32)
+            self.ids = [self.ids[row] for row in keep]
+            self.texts = [self.texts[row] for row in keep]
+            self.metadatas = [self.metadatas[row] for row in keep]
+            self._valid = np.ones(len(self.ids), dtype=bool)
+            tmp_path = self._matrix_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, self._matrix_path)
+        tmp_path = self._metadata_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "ids": self.ids,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+                "deleted": np.flatnonzero(~self._valid).tolist(),
+            }, f)
+        os.replace(tmp_path, self._metadata_path)
+        if keep is not None:
+            self.matrix = np.load(self._matrix_path, mmap_mode="r") if len(keep) else None
+        self._reset_saved_state()
+
+    def _full_matrix(self):
+        """Every row's vector (tombstoned rows included), folding in the buffered additions."""
+        np = self.np
+        if self._pending:
+            parts = [np.asarray(self.matrix)] if self.matrix is not None else []
+            self.matrix = np.concatenate(parts + self._pending)
+            self._pending = []
+        return self.matrix
+
+    def _reload_with_changes(self):
+        """Reload a store another process has written, then reapply this process's unsaved changes."""
+        added = [row for row in range(self._saved_rows, len(self.ids)) if self._valid[row]]
+        vectors = self.np.asarray(self._full_matrix()[added]) if added else None
+        added_ids = [self.ids[row] for row in added]
+        added_texts = [self.texts[row] for row in added]
+        added_metadatas = [self.metadatas[row] for row in added]
+        deleted_ids = self._deleted_ids
+        self._load()
+        self.delete_chunks(deleted_ids)
+        if added:
+            self.add_embedded(added_ids, vectors, added_texts, added_metadatas)
+        logging.info(f"Reloaded {self.persist_dir} after a write by another process")
+
+    def add_embedded(self, ids, embeddings, texts, metadatas):
+        """Store chunks whose embeddings were already computed; written out by persist()."""
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            self.delete_chunks([chunk_id for chunk_id in ids if chunk_id in self._rows])
+            first_row = len(self.ids)
+            metadatas = [dict(meta) for meta in metadatas]
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            for row, chunk_id, meta in zip(range(first_row, len(self.ids)), ids, metadatas):
+                self._rows[chunk_id] = row
+                self._doc_rows.setdefault(meta.get("doc_id"), []).append(row)
+            self._valid = self.np.concatenate([self._valid, self.np.ones(len(ids), dtype=bool)])
+            self._pending.append(vectors)
+            self._dirty = True
+
+    def add_chunks(self, doc_id, chunks):
+        """Embed and append chunks for doc_id; returns the new chunk ids."""
+        if not chunks:
+            return []
+        ids = [f"{doc_id}:{uuid.uuid4().hex}" for _ in chunks]
+        texts = [chunk.page_content for chunk in chunks]
+        self.add_embedded(
+            ids,
+            self.embeddings.embed_documents(texts),
+            texts,
+            [chunk_metadata(doc_id, chunk) for chunk in chunks],
+        )
+        return ids
+
+    def chunk_ids(self, doc_id):
+        """Return the ids of every chunk stored for doc_id."""
+        with self._lock:
+            return [self.ids[row] for row in self._doc_rows.get(doc_id, []) if self._valid[row]]
+
+    def delete_chunks(self, ids):
+        """Tombstone chunks by id (written out by persist()); returns how many were deleted."""
+        with self._lock:
+            rows = [self._rows.pop(chunk_id) for chunk_id in ids if chunk_id in self._rows]
+            if rows:
+                self._valid[rows] = False
+                self._deleted_ids.update(self.ids[row] for row in rows if row < self._saved_rows)
+                self._dirty = True
+            return len(rows)
+
+    def delete_document(self, doc_id):
+        """Remove every chunk belonging to doc_id; returns how many were deleted."""
+        deleted = self.delete_chunks(self.chunk_ids(doc_id))
+        if deleted:
+            logging.info(f"Deleted {deleted} chunks for document '{doc_id}'")
+        return deleted
+
+    def all_chunks(self):
+        """Return (ids, texts, metadatas) for every stored chunk."""
+        with self._lock:
+            rows = sorted(self._rows.values())
+            return ([self.ids[row] for row in rows], [self.texts[row] for row in rows],
+                    [self.metadatas[row] for row in rows])
+
+    def count(self, doc_id=None):
+        """Number of chunks in the store, or for one document."""
+        if doc_id is None:
+            return len(self._rows)
+        return len(self.chunk_ids(doc_id))
+
+    def persist(self):
+        """Write buffered additions and deletions to disk."""
+        with self._lock:
+            if not self._dirty:
+                return
+            with file_lock(self._lock_path):
+                if self._disk_signature() != self._signature:
+                    self._reload_with_changes()
+                if len(self.ids) == self._saved_rows:
+                    # Only tombstones changed, so the matrix on disk is still valid
+                    self._write()
+                else:
+                    # Rewriting the matrix is the point where tombstoned rows are dropped
+                    self._write(keep=self.np.flatnonzero(self._valid))
+
+    def compact(self, keep_doc_ids):
+        """
+        Rewrite the matrix and sidecar with only the chunks of keep_doc_ids, dropping
+        tombstoned rows. Returns {"kept_chunks", "removed_chunks", "removed_doc_ids"}.
+        """
+        with self._lock:
+            self.persist()
+            with file_lock(self._lock_path):
+                if self._disk_signature() != self._signature:
+                    self._load()
+                total = len(self.ids)
+                keep = sorted(
+                    row for row in self._rows.values()
+                    if self.metadatas[row].get("doc_id") in keep_doc_ids
+                )
+                removed_doc_ids = sorted({
+                    self.metadatas[row].get("doc_id") or "" for row in self._rows.values()
+                    if self.metadatas[row].get("doc_id") not in keep_doc_ids
+                })
+                self._write(keep=keep)
+        return {
+            "kept_chunks": len(keep),
+            "removed_chunks": total - len(keep),
+            "removed_doc_ids": removed_doc_ids,
+        }
+
+    def search(self, query_embeddings, k, doc_ids=None):
+        """
+        Exact cosine top-k for several query vectors with one matrix product. Returns, per query,
+        a list of {"id", "text", "metadata", "distance"} dicts (distance = 1 - cosine similarity).
+        """
+        np = self.np
+        with self._lock:
+            if not len(query_embeddings) or not self._rows:
+                return [[] for _ in query_embeddings]
+            queries = self._normalize(query_embeddings)
+            scores = queries @ np.asarray(self._full_matrix()).T
+
+            valid = self._valid
+            if doc_ids:
+                in_docs = np.zeros(len(self.ids), dtype=bool)
+                in_docs[np.asarray([row for doc_id in doc_ids for row in self._doc_rows.get(doc_id, ())],
+                                   dtype=np.intp)] = True
+                valid = valid & in_docs
+            scores[:, ~valid] = -np.inf
+            k = min(k, int(valid.sum()))
+            if k == 0:
+                return [[] for _ in query_embeddings]
+
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            results = []
+            for query_scores, rows in zip(scores, top):
+                rows = rows[np.argsort(-query_scores[rows])]
+                results.append([
+                    {
+                        "id": self.ids[row],
+                        "text": self.texts[row],
+                        "metadata": self.metadatas[row],
+                        "distance": float(1.0 - query_scores[row]),
+                    }
+                    for row in rows
+                ])
+            return results
+
+    def similarity_search(self, query, k=4, doc_ids=None):
+        """Return the k chunks closest to a query string as langchain Documents."""
+        from langchain_core.documents import Document
+
+        hits = self.search([self.embeddings.embed_query(query)], k, doc_ids)[0]
+        return [Document(page_content=hit["text"], metadata=hit["metadata"]) for hit in hits]
+
+    def as_retriever(self, doc_ids=None, **kwargs):
+        """Retriever over all documents, or only the given doc_ids."""
+        from langchain_core.retrievers import BaseRetriever
+
+        store = self
+        k = kwargs.get("search_kwargs", {}).get("k", 4)
+
+        class NumpyRetriever(BaseRetriever):
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                return store.similarity_search(query, k=k, doc_ids=doc_ids)
+
+        return NumpyRetriever()
+
+
+VECTOR_BACKENDS = {
+    "chroma": ChromaDocumentStore,
+    "numpy": NumpyDocumentStore,
+}
+
+
+def open_document_store(backend, vector_db_dir, embeddings):
+    """Open the shared store for backend ("chroma" or "numpy") under vector_db_dir."""
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend}")
+    # Each backend keeps its own directory so switching backends never mixes formats
+    name = USER_COLLECTION if backend == "chroma" else f"{USER_COLLECTION}_{backend}"
+    return VECTOR_BACKENDS[backend](os.path.join(vector_db_dir, name), embeddings)
+
+
+def migrate_per_document_stores(store, vector_db_dir, remove_old=False):
+    """
+    Copy chunks from the old one-directory-per-upload layout (vector_db/<name>/) into the
+    shared store, reusing their stored embeddings. Each directory name becomes the doc_id.
+    Returns {doc_id: chunks migrated}.
+    """
+    import chromadb
+
+    migrated = {}
+    if not os.path.isdir(vector_db_dir):
+        return migrated
+
+    for name in sorted(os.listdir(vector_db_dir)):
+        old_dir = os.path.join(vector_db_dir, name)
+        if name.startswith(store.collection_name) or not os.path.isdir(old_dir):
+            continue
+
+        client = chromadb.PersistentClient(path=old_dir)
+        # Replace anything a previous, interrupted migration copied; once per directory, since
+        # every collection in it is copied under the same doc_id
+        store.delete_document(name)
+        copied = 0
+        for old_collection in client.list_collections():
+            # Older chromadb returns Collection objects, newer returns names
+            collection_name = getattr(old_collection, "name", old_collection)
+            data = client.get_collection(collection_name).get(
+                include=["documents", "metadatas", "embeddings"]
+            )
+            if not data["ids"]:
+                continue
+            metadatas = [dict(meta or {}, doc_id=name) for meta in data["metadatas"]]
+            for meta in metadatas:
+                meta.setdefault("source", name)
+            store.add_embedded(
+                [f"{name}:{old_id}" for old_id in data["ids"]],
+                data["embeddings"],
+                data["documents"],
+                metadatas,
+            )
+            copied += len(data["ids"])
+
+        migrated[name] = copied
+        logging.info(f"Migrated {copied} chunks from {old_dir} into '{store.collection_name}'")
+        if remove_old:
+            del client
+            shutil.rmtree(old_dir)
+            logging.info(f"Removed {old_dir}")
+
+    store.persist()
+    return migrated
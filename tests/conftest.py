@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The pipeline modules import their siblings flat, as they do when run from their own directories
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+for path in (SRC_DIR, os.path.join(SRC_DIR, "rag_v4"), os.path.join(SRC_DIR, "onlineForms_v2")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
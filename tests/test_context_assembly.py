@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from quill_rag_v4 import assemble_context
+
+
+def chunk(text, start_index=None, page=1):
+    metadata = {"source": "form.pdf", "page": page}
+    if start_index is not None:
+        metadata["start_index"] = start_index
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+def test_overlapping_chunks_are_stitched():
+    text, tokens_saved = assemble_context([chunk("Name: Jane Doe\nPhone: ", 0), chunk("Phone: 555-0100", 15)])
+    assert text == "Name: Jane Doe\nPhone: 555-0100"
+    assert tokens_saved >= 0
+
+
+def test_non_adjacent_chunks_are_kept_apart():
+    text, _ = assemble_context([chunk("Patient name: Jane Doe", 0), chunk("Allergies: none", 400)])
+    assert text == "Patient name: Jane Doe\n...\nAllergies: none"
+
+
+def test_adjacent_chunks_are_joined_directly():
+    text, _ = assemble_context([chunk("Jane ", 0), chunk("Doe", 5)])
+    assert text == "Jane Doe"
+
+
+def test_chunks_without_offsets_or_overlap_get_a_newline():
+    text, _ = assemble_context([chunk("Patient name: Jane Doe"), chunk("Allergies: none")])
+    assert text == "Patient name: Jane Doe\nAllergies: none"
+
+
+def test_chunks_from_different_pages_stay_separate():
+    text, _ = assemble_context([chunk("First page", 0, page=1), chunk("Second page", 0, page=2)])
+    assert text == "First page Second page"
+
+
+def element(text, element_index, start_index=0):
+    # CSV rows and Word elements share a source, have no page, and each starts at offset 0
+    metadata = {"source": "records.csv", "element_index": element_index, "start_index": start_index}
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+def test_csv_rows_are_not_stitched_together():
+    rows = [element("name: Alice\nssn: 111-22-3333", 0), element("name: Bob\nssn: 777-88-9999 extra", 1)]
+    text, tokens_saved = assemble_context(rows)
+    assert text == "name: Alice\nssn: 111-22-3333 name: Bob\nssn: 777-88-9999 extra"
+    assert tokens_saved == 0
+
+
+def test_elements_without_pages_keep_their_own_overlaps():
+    chunks = [element("Allergies: penicillin", 0), element("Name: Jane ", 1), element("Jane Doe", 1, 6)]
+    text, _ = assemble_context(chunks)
+    assert text == "Allergies: penicillin Name: Jane Doe"
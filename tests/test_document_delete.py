@@ -0,0 +1,50 @@
+import pytest
+
+import quill_rag_v4
+from document_registry import DocumentRegistry
+from lexical_index import LexicalIndex
+
+
+class FakeVectorStore:
+    def __init__(self, chunks):
+        self.chunks = dict(chunks)   # chunk id -> doc_id
+
+    def chunk_ids(self, doc_id):
+        return [chunk_id for chunk_id, owner in self.chunks.items() if owner == doc_id]
+
+    def delete_chunks(self, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+
+    def persist(self):
+        pass
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    vector_store = FakeVectorStore({"paystub:1": "paystub", "paystub:2": "paystub", "lease:1": "lease"})
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+    lexical_index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    for chunk_id, doc_id in vector_store.chunks.items():
+        lexical_index.add_chunks([chunk_id], [f"text of {chunk_id}"], [{"doc_id": doc_id}])
+    registry.upsert("paystub", status="indexed", chunk_count=2)
+    registry.upsert("lease", status="indexed", chunk_count=1)
+    monkeypatch.setattr(quill_rag_v4, "get_vector_store", lambda: vector_store)
+    monkeypatch.setattr(quill_rag_v4, "get_document_registry", lambda: registry)
+    monkeypatch.setattr(quill_rag_v4, "get_lexical_index", lambda: lexical_index)
+    return vector_store, registry, lexical_index
+
+
+def test_delete_removes_the_document_everywhere(stores):
+    vector_store, registry, lexical_index = stores
+
+    result = quill_rag_v4.run_delete(document="uploads/Paystub.pdf")
+
+    assert result == {"status": "success", "doc_id": "paystub", "deleted_chunks": 2}
+    assert vector_store.chunks == {"lease:1": "lease"}
+    assert registry.get("paystub") is None and registry.get("lease") is not None
+    assert lexical_index.count() == 1
+
+
+def test_delete_of_an_unknown_document_fails(stores):
+    assert "error" in quill_rag_v4.run_delete(document="missing.pdf")
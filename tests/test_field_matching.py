@@ -0,0 +1,44 @@
+from quill_rag_v4 import pre_merge_fields
+
+
+def test_specific_field_maps_onto_the_general_field():
+    assert pre_merge_fields({"phone": "555-0100"}, {"mobile": "555-0199"}) == ({"mobile": "phone"}, [])
+
+
+def test_sibling_fields_are_left_to_the_llm():
+    assert pre_merge_fields({"homePhone": "555-0100"}, {"cellPhone": "555-0199"}) == ({}, ["cellPhone"])
+
+
+def test_general_field_is_not_mapped_onto_a_specific_one():
+    assert pre_merge_fields({"cellPhone": "555-0100"}, {"phone": "555-0199"}) == ({}, ["phone"])
+
+
+def test_generic_aliases_do_not_drive_a_merge():
+    # "status" alone could be marital or employment status
+    mapping, ambiguous = pre_merge_fields({"marital_status": "single"}, {"status": "active"})
+    assert mapping.get("status") != "marital_status"
+    assert ambiguous == ["status"]
+
+
+def test_exact_canonical_names_still_merge():
+    assert pre_merge_fields({"maritalStatus": "single"}, {"marital_status": "married"}) == (
+        {"marital_status": "maritalStatus"}, []
+    )
+
+
+def test_fields_the_schema_tells_apart_are_not_ambiguous():
+    current = {"first_name": "Ana", "company_address": "1 Main St", "appointment_date_1": "2024-05-01"}
+    new = {"company_name": "Acme", "address": "9 Elm St", "date": "2024-06-01"}
+    assert pre_merge_fields(current, new) == ({"company_name": None, "address": None, "date": None}, [])
+
+
+def test_shared_kind_words_alone_are_not_ambiguous():
+    current = {"landlord_name": "Bo", "hire_date": "2020-01-06"}
+    new = {"tenant_name": "Cy", "lease_date": "2021-03-01"}
+    assert pre_merge_fields(current, new) == ({"tenant_name": None, "lease_date": None}, [])
+
+
+def test_unknown_fields_sharing_a_distinctive_word_are_left_to_the_llm():
+    assert pre_merge_fields({"landlord_name": "Bo"}, {"landlord_phone_no": "555-0100"}) == (
+        {}, ["landlord_phone_no"]
+    )
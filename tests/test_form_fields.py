@@ -0,0 +1,54 @@
+from form_fields import detect_form_fields
+
+# OCR'd text of the sample student injury form the online form filler was written against
+SAMPLE_FORM_TEXT = """Student Injury Report
+* Indicates required question
+Email *
+Your email
+Full Name *
+Your answer
+Stanford ID *
+Your answer
+Date of Birth *
+Address *
+City
+State
+Zip Code
+Phone Number *
+University *
+Major *
+Grade
+Injury Description *
+E-Signature *
+Submit
+Clear form
+Never submit passwords through Google Forms.
+"""
+
+# The field lines the original keyword patterns detected on this form
+BASELINE_FIELDS = [
+    "Student Injury Report",
+    "Email ",
+    "Your email",
+    "Full Name ",
+    "Stanford ID ",
+    "Date of Birth ",
+    "Address ",
+    "City",
+    "State",
+    "Zip Code",
+    "Phone Number ",
+    "University ",
+    "Major ",
+    "Grade",
+    "Injury Description ",
+    "ESignature ",
+]
+
+
+def test_sample_form_fields_match_the_baseline():
+    assert detect_form_fields(SAMPLE_FORM_TEXT) == BASELINE_FIELDS
+
+
+def test_fields_are_not_repeated():
+    assert detect_form_fields("Email\nEmail\nCity") == ["Email", "City"]
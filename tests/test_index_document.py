@@ -0,0 +1,34 @@
+import pytest
+
+import quill_rag_v4
+from document_registry import DocumentRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+    registry.upsert("paystub", content_hash="old", source="paystub.pdf", status="indexed",
+                    chunk_count=4, page_count=2)
+    monkeypatch.setattr(quill_rag_v4, "get_document_registry", lambda: registry)
+    return registry
+
+
+@pytest.mark.parametrize("result", [(None, None), ([], None)])
+def test_failed_reingest_keeps_the_indexed_row(registry, monkeypatch, result):
+    monkeypatch.setattr(quill_rag_v4, "ingest_and_index", lambda *args: result)
+
+    doc_id, _, vector_db = quill_rag_v4.index_document("uploads/paystub.pdf", content_hash="new")
+
+    assert doc_id == "paystub" and vector_db is None
+    row = registry.get("paystub")
+    assert (row["status"], row["content_hash"], row["chunk_count"]) == ("indexed", "old", 4)
+    assert [entry["doc_id"] for entry in registry.list(status="indexed")] == ["paystub"]
+
+
+def test_failed_first_ingest_is_recorded(registry, monkeypatch):
+    monkeypatch.setattr(quill_rag_v4, "ingest_and_index", lambda *args: (None, None))
+
+    quill_rag_v4.index_document("uploads/lease.pdf", content_hash="lease")
+
+    row = registry.get("lease")
+    assert (row["status"], row["content_hash"]) == ("failed", "lease")
@@ -0,0 +1,33 @@
+import pytest
+
+import quill_rag_v4
+from profile_store import ProfileStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path / "user_info.sqlite3"), export_path=str(tmp_path / "user_info.json"))
+    monkeypatch.setattr(quill_rag_v4, "get_profile_store", lambda: store)
+    return store
+
+
+def test_conversation_update_keeps_fields_changed_since_the_snapshot(store, monkeypatch):
+    store.upsert({"email": "jane@example.com", "phone": "555-0100"})
+    snapshot = store.get_all()
+    # Another request changes a field after this one read the profile
+    store.upsert({"phone": "555-0199"})
+    monkeypatch.setattr(quill_rag_v4, "extract_key_value_info",
+                        lambda group, text, llm: {"email": "jane.doe@example.com"})
+
+    changes = quill_rag_v4.update_user_info_from_conversation("My email is jane.doe@example.com", None, snapshot)
+
+    assert changes["changed"] == {"email": "jane.doe@example.com"}
+    assert store.get_all() == {"email": "jane.doe@example.com", "phone": "555-0199"}
+
+
+def test_merge_returns_only_the_fields_to_write():
+    current = {"email": "jane@example.com", "phone": "555-0100"}
+    assert quill_rag_v4.merge_user_info(current, {"email": "jane.doe@example.com", "employer": "ACME"}, None) == {
+        "email": "jane.doe@example.com",
+        "employer": "ACME",
+    }